@@ -0,0 +1,129 @@
+import asyncio
+import functools
+import threading
+import weakref
+
+from concurrent.futures import ThreadPoolExecutor
+from .compiled import CompiledJob
+from .models import Job
+from .reader import Reader
+from .writer import Writer
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Python < 3.7: get_event_loop() is the running loop when called from a coroutine
+_get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+def get_executor():
+    """Get the DbExecutor shared by default by all async readers and writers"""
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = DbExecutor()
+
+        return _executor
+
+
+class DbExecutor():
+    """Runs all DB calls (and config parsing) in one dedicated thread, so they share
+    its connection without blocking the event loop. At most max_pending calls
+    wait for the thread, the other coroutines wait before submitting theirs"""
+
+    def __init__(self, max_pending: int = 100):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._max_pending = max_pending
+        # One semaphore per event loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+
+    async def run(self, func, *args, **kwargs):
+        loop = _get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self._max_pending)
+
+        async with self._semaphores[loop]:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait)
+
+
+class AsyncReader():
+    """Reader for asyncio. Create it with: reader = await AsyncReader.create(config_file, job)"""
+
+    def __init__(self, reader: Reader, executor: DbExecutor):
+        self._reader = reader
+        self._executor = executor
+
+
+    @classmethod
+    async def create(cls, config_file: str, job: str, use_cache: bool = True, executor: DbExecutor = None):
+        executor = executor or get_executor()
+        reader = await executor.run(Reader, config_file, job, use_cache)
+
+        return cls(reader, executor)
+
+
+    async def get_job(self) -> Job:
+        return await self._executor.run(self._reader.get_job)
+
+
+    async def get_hooks(self) -> list:
+        return await self._executor.run(lambda: list(self._reader.get_hooks()))
+
+
+    async def get_fields(self) -> list:
+        return await self._executor.run(self._reader.get_fields)
+
+
+    async def get_compiled(self) -> CompiledJob:
+        return await self._executor.run(self._reader.get_compiled)
+
+
+    async def get_prop(self, prop: str):
+        return await self._executor.run(self._reader.get_prop, prop)
+
+
+class AsyncWriter():
+    """Writer for asyncio. Create it with: writer = await AsyncWriter.create(config_file, job)
+    Changes are made in memory (set_prop, fields_writer, hooks_writer). get_job(), get_prop(),
+    save() and delete() are awaitable: they run in the executor thread, after the calls before them"""
+
+    def __init__(self, writer: Writer, executor: DbExecutor):
+        self._writer = writer
+        self._executor = executor
+        self.fields_writer = writer.fields_writer
+        self.hooks_writer = writer.hooks_writer
+
+
+    @classmethod
+    async def create(cls, config_file: str, job: str = None, executor: DbExecutor = None):
+        executor = executor or get_executor()
+        writer = await executor.run(Writer, config_file, job)
+
+        return cls(writer, executor)
+
+
+    async def get_job(self) -> Job:
+        return await self._executor.run(self._writer.get_job)
+
+
+    async def get_prop(self, prop: str):
+        return await self._executor.run(self._writer.get_prop, prop)
+
+
+    def set_prop(self, prop: str, value) -> None:
+        self._writer.set_prop(prop, value)
+
+
+    async def save(self) -> Job:
+        return await self._executor.run(self._writer.save)
+
+
+    async def delete(self) -> None:
+        await self._executor.run(self._writer.delete)
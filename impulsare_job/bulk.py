@@ -0,0 +1,238 @@
+import json
+
+from .db import Db
+from .models import Field, Hook, Job, Rule, SQLITE_MAX_VARIABLES
+from .reader import Reader
+from .writer import Writer, delete_many, finish_save, insert_many
+
+
+FORMATS = ('jsonl', 'yaml')
+
+_hook_props = ('name', 'method', 'when', 'description', 'active', 'priority')
+_rule_props = ('name', 'method', 'description', 'active', 'params', 'blocking', 'priority')
+
+
+class Exporter(Db):
+    """Export jobs, with their hooks, fields and rules, as JSON Lines
+    (one job per line) or YAML (one job per document)"""
+
+    def export(self, stream, format: str = 'jsonl', batch_size: int = 500) -> int:
+        """Write all jobs to a text stream, reading them by batch. Returns the number of jobs"""
+
+        dump = self._get_dumper(format)
+
+        exported = 0
+        for job in self.iter_jobs(batch_size):
+            stream.write(dump(job))
+            exported += 1
+
+        return exported
+
+
+    def iter_jobs(self, batch_size: int = 500):
+        """Generator on all jobs as dicts, ordered by id"""
+
+        last_id = 0
+        while True:
+            ids = [job.id for job in Job.select(Job.id).where(Job.id > last_id).order_by(Job.id).limit(batch_size)]
+            if len(ids) == 0:
+                return
+
+            readers = Reader._load(self, Job.id << ids)
+            for reader in sorted(readers.values(), key=lambda reader: reader.get_job().id):
+                yield self._to_dict(reader)
+
+            last_id = ids[-1]
+
+
+    def _get_dumper(self, format: str):
+        if format == 'jsonl':
+            return lambda job: json.dumps(job, sort_keys=True) + '\n'
+
+        if format == 'yaml':
+            import yaml
+            return lambda job: yaml.safe_dump(job, explicit_start=True, default_flow_style=False)
+
+        raise ValueError('{} is not a valid format ({})'.format(format, ' - '.join(FORMATS)))
+
+
+    def _to_dict(self, reader: Reader) -> dict:
+        job = reader.get_job()
+        data = dict((prop, getattr(job, prop)) for prop in self._job_props_type)
+
+        data['hooks'] = [dict((prop, getattr(hook, prop)) for prop in _hook_props)
+                         for hook in reader.get_hooks()]
+        data['fields'] = [{'input': field.input, 'output': field.output,
+                           'rules': [dict((prop, getattr(rule, prop)) for prop in _rule_props)
+                                     for rule in field.rules]}
+                          for field in reader.get_fields()]
+
+        return data
+
+
+class Importer(Db):
+    """Import jobs exported by the Exporter. Jobs are validated like with the
+    Writer, then each batch is written in one transaction, with multi-rows
+    INSERTs for the jobs, hooks, fields and rules"""
+
+    def import_jobs(self, stream, format: str = 'jsonl', batch_size: int = 500, replace: bool = True) -> int:
+        """Read jobs from a text stream, one by one, and save them. Existing jobs are
+        replaced (keeping their id), unless replace is False (then it's an error). If a
+        job is invalid, its batch is rolled back and a ValueError is raised. Returns the
+        number of jobs"""
+
+        batch_size = max(1, min(batch_size, SQLITE_MAX_VARIABLES))
+
+        imported = 0
+        batch = list()
+        for job in self._get_loader(format)(stream):
+            batch.append(job)
+            if len(batch) == batch_size:
+                imported += self._save_batch(batch, imported, replace)
+                batch = list()
+
+        imported += self._save_batch(batch, imported, replace)
+
+        return imported
+
+
+    def _get_loader(self, format: str):
+        if format == 'jsonl':
+            return lambda stream: (json.loads(line) for line in stream if line.strip() != '')
+
+        if format == 'yaml':
+            import yaml
+            return lambda stream: (job for job in yaml.safe_load_all(stream) if job is not None)
+
+        raise ValueError('{} is not a valid format ({})'.format(format, ' - '.join(FORMATS)))
+
+
+    def _save_batch(self, batch: list, offset: int, replace: bool) -> int:
+        if len(batch) == 0:
+            return 0
+
+        self._use_db()
+        names = [job.get('name') if isinstance(job, dict) else None for job in batch]
+        existing = dict(Job.select(Job.name, Job.id).where(Job.name << names).tuples())
+
+        # Everything is validated before anything is written
+        writers = list()
+        for i, job in enumerate(batch):
+            try:
+                if names[i] is not None and names.index(names[i]) != i:
+                    raise ValueError('The job is already in the import')
+                if names[i] in existing and replace is False:
+                    raise ValueError('The job already exists')
+
+                writers.append(self._get_writer(job))
+            except (KeyError, ValueError, TypeError) as e:
+                raise ValueError('Job #{} ({}) is not valid: {}'.format(offset + i + 1, names[i], e))
+
+        try:
+            with self._db.atomic():
+                self._write_jobs(writers, existing)
+        except Exception as e:
+            raise RuntimeError("Can't import the jobs #{} to #{} ({})".format(offset + 1, offset + len(batch), e))
+        finally:
+            if self._cache is not None:
+                for name in names:
+                    self._cache.invalidate(name)
+
+        return len(batch)
+
+
+    def _get_writer(self, job: dict) -> Writer:
+        """A Writer with the job, to validate it. It's not saved"""
+
+        if isinstance(job, dict) is False:
+            raise ValueError('a job is an object, not {}'.format(type(job).__name__))
+
+        # Shares our config and DB: nothing to read again for each job
+        writer = Writer(self)
+        for prop, value in job.items():
+            if prop in ('hooks', 'fields'):
+                continue
+
+            # Optional props that are empty in the export keep their empty default
+            if value is None and writer.get_prop(prop) is None:
+                continue
+
+            writer.set_prop(prop, value)
+
+        for hook in job.get('hooks', []):
+            writer.hooks_writer.add_hook(**hook)
+
+        for field in job.get('fields', []):
+            writer.fields_writer.add_field(field['input'], field['output'])
+            for rule in field.get('rules', []):
+                writer.fields_writer.add_rule(field['output'], **rule)
+
+        writer._verify_required_values()
+
+        return writer
+
+
+    def _write_jobs(self, writers: list, existing: dict) -> None:
+        """Write the jobs validated by the writers. Jobs that exist (name -> id)
+        are updated and their hooks, fields and rules replaced"""
+
+        jobs = list()
+        for writer in writers:
+            jobs.append(dict((prop, writer.get_prop(prop)) for prop in self._job_props_type))
+
+        replaced = [existing[job['name']] for job in jobs if job['name'] in existing]
+        fields_ids = [field_id for field_id, in Field.select(Field.id).where(Field.job << replaced).tuples()]
+        delete_many(Rule, Rule.field, fields_ids)
+        delete_many(Field, Field.job, replaced)
+        delete_many(Hook, Hook.job, replaced)
+        for job in jobs:
+            if job['name'] in existing:
+                Job.update(**job).where(Job.id == existing[job['name']]).execute()
+
+        insert_many(Job, [job for job in jobs if job['name'] not in existing])
+        names = [job['name'] for job in jobs]
+        jobs_ids = dict(Job.select(Job.name, Job.id).where(Job.name << names).tuples())
+
+        hooks = list()
+        fields = list()
+        for writer in writers:
+            job_id = jobs_ids[writer.get_prop('name')]
+            hooks += [dict(hook, job=job_id) for hook in writer.hooks_writer.get_hooks().values()]
+            fields += [{'input': field['input'], 'output': output, 'job': job_id}
+                       for output, field in writer.fields_writer.get_fields().items()]
+
+        insert_many(Hook, hooks)
+        insert_many(Field, fields)
+
+        # (job id, output) -> field id, to link the rules
+        ids = list(jobs_ids.values())
+        query = Field.select(Field.job, Field.output, Field.id).where(Field.job << ids)
+        fields_ids = dict(((job_id, output), field_id) for job_id, output, field_id in query.tuples())
+
+        rules = list()
+        for writer in writers:
+            job_id = jobs_ids[writer.get_prop('name')]
+            for output, field in writer.fields_writer.get_fields().items():
+                for name, rule in field['rules'].items():
+                    rules.append(dict(writer.fields_writer._get_rule_row(name, rule),
+                                      field=fields_ids[(job_id, output)]))
+
+        insert_many(Rule, rules)
+
+        # The writers now know the ids, as if they had saved their job
+        query = Hook.select(Hook.job, Hook.name, Hook.id).where(Hook.job << ids)
+        hooks_ids = dict(((job_id, name), hook_id) for job_id, name, hook_id in query.tuples())
+        query = Rule.select(Field.job, Field.output, Rule.name, Rule.id).join(Field).where(Field.job << ids)
+        rules_ids = dict(((job_id, output, name), rule_id) for job_id, output, name, rule_id in query.tuples())
+        for writer, job in zip(writers, jobs):
+            job_id = jobs_ids[job['name']]
+            writer._job = Job(id=job_id, **job)
+            writer.hooks_writer._set_saved(dict((name, hooks_ids[(job_id, name)])
+                                                for name in writer.hooks_writer.get_hooks()))
+            writer.fields_writer._set_saved(
+                dict((output, fields_ids[(job_id, output)]) for output in writer.fields_writer.get_fields()),
+                dict(((output, name), rules_ids[(job_id, output, name)])
+                     for output, field in writer.fields_writer.get_fields().items() for name in field['rules']))
+
+        # One revision for the whole batch, like the Writer does
+        finish_save(self, writers)
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+# Values not set in job.cache. Without job.cache, there is no cache
+DEFAULT_CACHE = {
+    'size': 256,  # jobs, 0 to disable the cache
+    'ttl': 5,  # seconds before checking again the revision of a job in DB
+    }
+
+# DB file -> (DB, JobCache)
+_caches = dict()
+_caches_lock = threading.Lock()
+
+
+def get_cache(db, config: dict = None):
+    """Get the cache of jobs shared by all readers of a DB, None if disabled (no job.cache
+    in the config, or a size of 0). A new cache is created when the DB file has been reopened"""
+
+    if config is None:
+        return None
+
+    config = dict(DEFAULT_CACHE, **config)
+    if config['size'] == 0:
+        return None
+
+    with _caches_lock:
+        if db.database not in _caches or _caches[db.database][0] is not db:
+            _caches[db.database] = (db, JobCache(config['size'], config['ttl']))
+
+        return _caches[db.database][1]
+
+
+class JobCache():
+    """LRU cache of loaded jobs by name. An entry is trusted for ttl seconds,
+    then its revision is compared to the one in DB (changes from other processes)"""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, name: str, get_revision):
+        """Get the data cached for a job or None. get_revision() is called to
+        get the current revision from the DB when the entry is too old"""
+
+        with self._lock:
+            if name not in self._entries:
+                return None
+
+            revision, checked_at, data = self._entries[name]
+            self._entries.move_to_end(name)
+
+        if time.monotonic() - checked_at < self.ttl:
+            return data
+
+        if get_revision() != revision:
+            self.invalidate(name)
+            return None
+
+        self.set(name, revision, data)
+
+        return data
+
+
+    def set(self, name: str, revision: int, data) -> None:
+        with self._lock:
+            self._entries[name] = (revision, time.monotonic(), data)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+    def invalidate(self, name: str = None) -> None:
+        """Remove a job from the cache, or all jobs"""
+
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
@@ -0,0 +1,62 @@
+from collections import namedtuple
+
+from .serializers import decode
+
+
+# Read only representation of a job, compact and picklable. Parameters are decoded,
+# hooks and rules sorted by priority, fields by output.
+CompiledJob = namedtuple('CompiledJob', (
+    'id', 'name', 'description', 'active', 'mode', 'input', 'input_parameters',
+    'output', 'output_parameters', 'priority', 'revision', 'hooks', 'fields'))
+
+CompiledHook = namedtuple('CompiledHook', (
+    'id', 'name', 'description', 'active', 'method', 'when', 'priority'))
+
+CompiledField = namedtuple('CompiledField', ('id', 'input', 'output', 'rules'))
+
+CompiledRule = namedtuple('CompiledRule', (
+    'id', 'name', 'description', 'active', 'method', 'params', 'blocking', 'priority'))
+
+# Bump it when the encoding of a CompiledJob changes: older snapshots are then ignored
+SNAPSHOT_VERSION = 2
+
+
+def compile_job(job, hooks, fields) -> CompiledJob:
+    """Build a CompiledJob from the models loaded by a Reader"""
+
+    compiled_hooks = tuple(
+        CompiledHook(hook.id, hook.name, hook.description, hook.active, hook.method,
+                     hook.when, hook.priority)
+        for hook in sorted(hooks, key=lambda hook: hook.priority))
+
+    compiled_fields = tuple(
+        CompiledField(field.id, field.input, field.output, tuple(
+            CompiledRule(rule.id, rule.name, rule.description, rule.active, rule.method,
+                         rule.params, rule.blocking, rule.priority)
+            for rule in sorted(field.rules, key=lambda rule: rule.priority)))
+        for field in fields)
+
+    return CompiledJob(job.id, job.name, job.description, job.active, job.mode, job.input,
+                       job.input_parameters, job.output, job.output_parameters, job.priority,
+                       job.revision, compiled_hooks, compiled_fields)
+
+
+def encode_job(job: CompiledJob, codec):
+    """Serialize a CompiledJob to store it as a snapshot (nested arrays), with the codec
+    of the DB: the parameters are then decoded exactly as the ones from the tables"""
+
+    hooks = [list(hook) for hook in job.hooks]
+    fields = [[field.id, field.input, field.output, [list(rule) for rule in field.rules]] for field in job.fields]
+
+    return codec.encode(list(job[:11]) + [hooks, fields])
+
+
+def decode_job(data) -> CompiledJob:
+    """Build a CompiledJob from encode_job() data, whatever its codec"""
+
+    values = decode(data)
+    hooks = tuple(CompiledHook(*hook) for hook in values[11])
+    fields = tuple(CompiledField(field[0], field[1], field[2], tuple(CompiledRule(*rule) for rule in field[3]))
+                   for field in values[12])
+
+    return CompiledJob(*values[:11], hooks=hooks, fields=fields)
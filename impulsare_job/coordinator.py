@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+from peewee import OperationalError
+from .db import Db
+from .writer import Writer
+
+
+class WriteCoordinator():
+    """Single writer for a DB: saves are submitted to one thread that commits all
+    the pending ones together (group commit: one transaction, one fsync). Each save
+    runs in its own savepoint, so a failing job doesn't cancel the others.
+
+    The write lock is taken when the transaction starts (BEGIN IMMEDIATE) and the
+    whole group is retried, with a backoff, when another process holds it"""
+
+    def __init__(self, config_file: str, max_batch: int = 100, retries: int = 5, retry_delay: float = 0.1):
+        self._config_file = config_file
+        self._max_batch = max_batch
+        self._retries = retries
+        self._retry_delay = retry_delay
+        self._db = Db(config_file)._db
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='impulsare_job_writer', daemon=True)
+        self._thread.start()
+
+
+    def submit(self, writer: Writer) -> Future:
+        """Queue a save. The Future gets the saved Job, or the error raised by
+        Writer.save(). Don't modify the writer until it's done"""
+
+        future = Future()
+        if writer._db is not self._db:
+            future.set_exception(ValueError("The writer doesn't use the coordinator's DB"))
+            return future
+
+        self._queue.put((writer, future))
+
+        return future
+
+
+    def save(self, writer: Writer):
+        """Same as submit() but waits for the job to be saved"""
+
+        return self.submit(writer).result()
+
+
+    def stop(self) -> None:
+        """Save what has been submitted then stop the writer thread"""
+
+        self._queue.put(None)
+        self._thread.join()
+
+
+    def _run(self) -> None:
+        db = Db(self._config_file)
+        stop = False
+        while stop is False:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            while len(batch) < self._max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    stop = True
+                    break
+
+                batch.append(item)
+
+            batch = [(writer, future) for writer, future in batch if future.set_running_or_notify_cancel()]
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # Never end the thread: the next saves would wait forever
+                for writer, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("Can't save the jobs ({})".format(e)))
+
+        db.close()
+
+
+    def _commit(self, batch: list) -> None:
+        for attempt in range(self._retries + 1):
+            states = [writer._get_state() for writer, future in batch]
+            results = list()
+            try:
+                with self._db.atomic('IMMEDIATE'):
+                    for writer, future in batch:
+                        try:
+                            results.append((future, writer.save(), None))
+                        except Exception as e:
+                            # RuntimeError from the DB, ValueError for a missing prop...
+                            results.append((future, None, e))
+
+                break
+            except OperationalError as e:
+                # Nothing has been committed
+                for (writer, future), state in zip(batch, states):
+                    writer._set_state(state)
+
+                if attempt == self._retries or 'locked' not in str(e):
+                    for writer, future in batch:
+                        future.set_exception(RuntimeError("Can't save the jobs ({})".format(e)))
+                    return
+
+                time.sleep(self._retry_delay * 2 ** attempt)
+
+        for writer, future in batch:
+            # Readers could have cached the previous version before the commit
+            writer._invalidate_cache(writer.get_job().name)
+
+        for future, job, error in results:
+            if error is None:
+                future.set_result(job)
+            else:
+                future.set_exception(error)
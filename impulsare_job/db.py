@@ -1,8 +1,41 @@
 import os
+import threading
 
 from impulsare_logger import Logger
 from impulsare_config import Reader as ConfigReader
-from .models import open_db
+from .cache import get_cache
+from .models import open_db, use_db
+
+
+# Process wide registry: config file -> (mtime, parsed config, logger)
+_registry = dict()
+_registry_lock = threading.Lock()
+
+
+def get_config(config_file: str = None) -> tuple:
+    """Parse a config file once and share the config and its logger
+    between all Db instances until the file changes"""
+
+    try:
+        mtime = os.path.getmtime(config_file)
+    except (OSError, TypeError):
+        mtime = None
+
+    with _registry_lock:
+        if config_file in _registry and _registry[config_file][0] == mtime:
+            return _registry[config_file][1:]
+
+        base_path = os.path.abspath(os.path.dirname(__file__))
+        config_specs = base_path + '/static/specs.yml'
+        config_default = base_path + '/static/default.yml'
+
+        config = ConfigReader().parse(config_file, config_specs, config_default)
+        logger = Logger('job', config_file)
+        logger.log.info('Opening SQLite DB "{}"'.format(config.get('job')['db']))
+
+        _registry[config_file] = (mtime, config, logger)
+
+        return config, logger
 
 
 class Db():
@@ -22,18 +55,39 @@ class Db():
 
 
     def __init__(self, config_file: str = None):
-        """Write logs to a file, with the app's name"""
+        """Get the config, the logger and the DB shared by all instances. With
+        a Db instead of a config file, share its ones (nothing is read again)"""
 
+        if isinstance(config_file, Db):
+            db = config_file
+            self._config, self._logger, self._db, self._cache = db._config, db._logger, db._db, db._cache
+            self._codec = db._codec
+            return
 
-        base_path = os.path.abspath(os.path.dirname(__file__))
-        config_specs = base_path + '/static/specs.yml'
-        config_default = base_path + '/static/default.yml'
+        self._config, self._logger = get_config(config_file)
+        job_config = self._config.get('job')
+        self._db = open_db(job_config['db'], job_config.get('sqlite'), job_config.get('pool'),
+                           job_config.get('codec'))
+        self._cache = get_cache(self._db, job_config.get('cache'))
+        # Set when the DB file is opened: the one of the first config using it
+        self._codec = self._db.codec
+
+
+    def close(self) -> None:
+        """Give the connection of the current thread back to the pool. To call
+        before a thread ends, else its connection is lost for the others"""
+
+        self._db.close()
 
-        self._config = ConfigReader().parse(config_file, config_specs, config_default)
-        self._logger = Logger('job', config_file)
-        self._logger.log.info('Opening SQLite DB "{}"'.format(self._config.get('job')['db']))
 
-        self._db = open_db(self._config.get('job')['db'])
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """Leaving a with block closes, see close()"""
+
+        self.close()
 
 
     def get_job_prop_type(self, prop: str):
@@ -41,3 +95,10 @@ class Db():
             raise KeyError('{} is not a valid job property'.format(prop))
 
         return self._job_props_type[prop]
+
+
+    def _use_db(self) -> None:
+        """Make sure the models use our DB in the current thread, in case
+        another Db for a different file has been created since"""
+
+        use_db(self._db)
@@ -1,27 +1,336 @@
 import datetime
+import os
+import threading
 
 from peewee import BooleanField, CharField, DateTimeField, ForeignKeyField, IntegerField, TextField
-from peewee import Model, Proxy
-from playhouse.sqlite_ext import SqliteExtDatabase
+from peewee import FieldAccessor, Model, Proxy, fn
+from playhouse.pool import PooledSqliteExtDatabase
+from playhouse.sqlite_ext import FTS5Model, SearchField
+from .serializers import decode, get_codec
 
 
-database_proxy = Proxy()
+# Bump it each time the tables change, to run init_schema() again on existing DBs
+SCHEMA_VERSION = 9
 
+# Max number of bound parameters in a query for SQLite < 3.32
+SQLITE_MAX_VARIABLES = 999
 
-def open_db(db_name: str):
-    db = SqliteExtDatabase(db_name)
-    database_proxy.initialize(db)
+# Tuned for many readers and a writer on the same file. Override it with job.sqlite in the config
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64000,  # 64MB
+    'mmap_size': 268435456,  # 256MB
+    'temp_store': 'memory',
+    'busy_timeout': 5000,  # ms
+    }
+
+# Connections pool of each DB. Override it with job.pool in the config
+DEFAULT_POOL = {
+    'max_connections': 32,  # at most one per thread using the DB
+    'stale_timeout': 300,  # seconds before an idle connection is closed
+    'timeout': 10,  # seconds to wait for a connection when they are all used, 0 = forever
+    }
+
+
+class ThreadLocalProxy(Proxy):
+    """The DB used by the models is set per thread, so threads using different DBs
+    don't clobber each other. A thread that never set one can't use the models"""
+
+    __slots__ = ('_local',)
+
+    def __init__(self):
+        object.__setattr__(self, '_local', threading.local())
+        Proxy.__init__(self)
+
+
+    def __setattr__(self, attr, value):
+        object.__setattr__(self, attr, value)
+
+
+    def __getattr__(self, attr):
+        db = self.obj
+        if db is None:
+            raise AttributeError('No DB for the current thread, open one first (Reader, Writer or open_db())')
+
+        return getattr(db, attr)
+
+
+    @property
+    def obj(self):
+        """The DB of the current thread, None if it has none (like an uninitialized Proxy)"""
+
+        return getattr(self._local, 'obj', None)
+
+
+    def initialize(self, obj):
+        self._local.obj = obj
+        for callback in self._callbacks:
+            callback(obj)
+
+
+class ThreadPooledDatabase(PooledSqliteExtDatabase):
+    """Pool of connections, one per thread. A connection is given back to the pool
+    by close(), or when the thread that got it ends: a backstop relying on internals
+    of the peewee pool (_in_use, conn_key(), _close()), see requirements.txt"""
+
+    def _connect(self):
+        conn = PooledSqliteExtDatabase._connect(self)
+
+        connections = getattr(_thread_connections, 'connections', None)
+        if connections is None:
+            connections = _thread_connections.connections = _ThreadConnections()
+        connections.add(self, conn)
+
+        return conn
+
+
+class _ThreadConnections(list):
+    """Connections taken from the pools by a thread, with their entry in the pool
+    (a new one each time a connection is taken). Deleted when the thread ends"""
+
+    def add(self, db, conn) -> None:
+        # Forget the ones given back since
+        self[:] = [entry for entry in self if self._is_taken(*entry)]
+        self.append((db, conn, db._in_use[db.conn_key(conn)]))
+
+
+    def __del__(self):
+        for db, conn, pool_conn in self:
+            if self._is_taken(db, conn, pool_conn):
+                db._close(conn)
+
+
+    @staticmethod
+    def _is_taken(db, conn, pool_conn) -> bool:
+        """Neither given back by the thread nor taken by another one since"""
+
+        return db._in_use.get(db.conn_key(conn)) is pool_conn
+
+
+database_proxy = ThreadLocalProxy()
+
+# Connections taken by the current thread (see ThreadPooledDatabase)
+_thread_connections = threading.local()
+
+# DB file -> opened DB, shared by all callers
+_databases = dict()
+_databases_lock = threading.RLock()
+# DB file -> identity of the file (device, inode) when its schema has been initialized
+_schema_ready = dict()
+
+
+def open_db(db_name: str, pragmas: dict = None, pool: dict = None, codec: str = None):
+    """Get the DB for a file, opened once per process with a pool of connections
+    (one per thread). It's reopened if the file has been deleted or replaced since.
+    The DB becomes the one used by the models in the current thread. Its codec
+    (db.codec) writes the parameters, see serializers.get_codec()"""
+
+    with _databases_lock:
+        db = _databases.get(db_name)
+        if db is None or _schema_ready.get(db_name, None) not in (None, _get_file_identity(db_name)):
+            if db is not None:
+                db.close_all()
+
+            # A pooled connection can be reused by another thread, one thread at a time
+            pool = dict(DEFAULT_POOL, **(pool or {}))
+            db = ThreadPooledDatabase(db_name, pragmas=get_pragmas(pragmas),
+                                      check_same_thread=False, **pool)
+            db.codec = get_codec(codec)
+            _databases[db_name] = db
+            _schema_ready.pop(db_name, None)
+
+        use_db(db)
+        init_schema(db)
 
     return db
 
 
-class BaseModel(Model):
-    def __init__(self, **kwargs):
-        if self.table_exists() is False:
-            self.create_table()
+def use_db(db) -> None:
+    """Set the DB used by the models in the current thread"""
+
+    if database_proxy.obj is not db:
+        database_proxy.initialize(db)
+
+
+def get_pragmas(pragmas: dict = None) -> list:
+    """Default pragmas overriden by the ones given, journal_mode first"""
+
+    pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+    journal_mode = ('journal_mode', pragmas.pop('journal_mode'))
+
+    return [journal_mode] + sorted(pragmas.items())
+
+
+def init_schema(db) -> None:
+    """Create the tables once per DB file. The version is kept in the file
+    (PRAGMA user_version) and in memory, so it's never checked again"""
+
+    identity = _get_file_identity(db.database)
+    if identity is not None and _schema_ready.get(db.database) == identity:
+        return
+
+    version = db.execute_sql('PRAGMA user_version').fetchone()[0]
+    if version < SCHEMA_VERSION:
+        with db.atomic():
+            _migrate(db)
+            # Tables and indexes are created "IF NOT EXISTS": also migrates existing DBs
+            db.create_tables(MODELS, safe=True)
+            db.execute_sql('PRAGMA user_version = {:d}'.format(SCHEMA_VERSION))
+
+    # Not with the version: the DB can have been created or changed by a process without FTS5
+    check_search_index(db)
+
+    identity = _get_file_identity(db.database)
+    if identity is not None:
+        _schema_ready[db.database] = identity
+
+
+def has_search() -> bool:
+    """Is SQLite built with FTS5, needed by the search index"""
+
+    global _fts5
+    if _fts5 is None:
+        _fts5 = JobSearch.fts5_installed()
+
+    return _fts5
+
+
+def update_search_index(db, jobs_ids: list = None) -> None:
+    """Index the jobs with their fields and rules (all jobs if no ids are given), in SQL.
+    Deleted jobs are removed from the index. If FTS5 is not available, the index is
+    marked as stale in the DB, to be rebuilt by the next process with FTS5"""
+
+    if has_search() is False:
+        Setting.insert(name=SEARCH_STALE, value='1').on_conflict_replace().execute()
+        return
+
+    if jobs_ids is None:
+        db.execute_sql('DELETE FROM jobsearch')
+        db.execute_sql(_SEARCH_INDEX_SQL)
+        return
+
+    for i in range(0, len(jobs_ids), SQLITE_MAX_VARIABLES):
+        ids = jobs_ids[i:i + SQLITE_MAX_VARIABLES]
+        placeholders = ', '.join('?' * len(ids))
+        db.execute_sql('DELETE FROM jobsearch WHERE rowid IN ({})'.format(placeholders), ids)
+        db.execute_sql('{} WHERE j.id IN ({})'.format(_SEARCH_INDEX_SQL, placeholders), ids)
+
+
+def check_search_index(db) -> None:
+    """Create the search index if it's missing (DB created without FTS5 or by a version
+    without the index) and index all jobs again if it's stale. Does nothing without FTS5"""
 
-        Model.__init__(self, **kwargs)
+    if has_search() is False:
+        return
 
+    with db.atomic():
+        if db.table_exists(JobSearch._meta.table_name) and is_search_stale() is False:
+            return
+
+        db.create_tables([JobSearch], safe=True)
+        update_search_index(db)
+        Setting.delete().where(Setting.name == SEARCH_STALE).execute()
+
+
+def is_search_stale() -> bool:
+    """Have jobs been saved by a process without FTS5 since the index was built"""
+
+    return Setting.select().where(Setting.name == SEARCH_STALE).exists()
+
+
+# One document per job (rowid = job id)
+_SEARCH_INDEX_SQL = """
+    INSERT INTO jobsearch (rowid, name, description, fields, rules)
+    SELECT j.id, j.name, COALESCE(j.description, ''),
+        COALESCE((SELECT group_concat(COALESCE(f.input, '') || ' ' || COALESCE(f.output, ''), ' ')
+                  FROM field f WHERE f.job_id = j.id), ''),
+        COALESCE((SELECT group_concat(r.name || ' ' || r.method || ' ' || COALESCE(r.description, ''), ' ')
+                  FROM rule r JOIN field f ON r.field_id = f.id WHERE f.job_id = j.id), '')
+    FROM job j"""
+
+# Set by has_search()
+_fts5 = None
+
+# Name of the setting written when the search index is not up to date
+SEARCH_STALE = 'search_stale'
+
+
+def _migrate(db) -> None:
+    """Add the columns missing from the tables created by a previous version"""
+
+    for model in MODELS:
+        table = model._meta.table_name
+        if not db.table_exists(table):
+            continue
+
+        columns = [column.name for column in db.get_columns(table)]
+        for field in model._meta.sorted_fields:
+            if field.column_name not in columns:
+                db.execute_sql('ALTER TABLE "{}" ADD COLUMN {}'.format(table, _get_column_ddl(field)))
+
+
+def _get_column_ddl(field) -> str:
+    ddl = '"{}" {}'.format(field.column_name, field.field_type)
+    if field.null is False:
+        default = int(field.default) if isinstance(field.default, bool) else field.default
+        ddl += ' NOT NULL DEFAULT {!r}'.format(default)
+
+    return ddl
+
+
+def _get_file_identity(db_name: str):
+    """A recreated (or deleted) DB file must get its schema again"""
+    try:
+        stat = os.stat(db_name)
+    except OSError:
+        return None
+
+    return (stat.st_dev, stat.st_ino)
+
+
+class ParamsAccessor(FieldAccessor):
+    """Decode the parameters on first access only, and keep them in place of the
+    encoded ones. The field is then dirty: changes made in place to the decoded
+    dict or list are saved with the model"""
+
+    def __get__(self, instance, instance_type=None):
+        if instance is None:
+            return self.field
+
+        value = instance.__data__.get(self.name)
+        if isinstance(value, (str, bytes)):
+            value = instance.__data__[self.name] = decode(value)
+            instance._dirty.add(self.name)
+
+        return value
+
+
+class ParamsField(TextField):
+    """Encoded parameters (see serializers): JSON text, or binary data
+    stored as is (a BLOB for SQLite, whatever the column type)"""
+
+    accessor_class = ParamsAccessor
+
+    def db_value(self, value):
+        if isinstance(value, bytes):
+            return value
+
+        if isinstance(value, (dict, list)):
+            # The codec of the DB used in the current thread (see open_db())
+            return database_proxy.codec.encode(value)
+
+        return TextField.db_value(self, value)
+
+
+    def python_value(self, value):
+        if isinstance(value, bytes):
+            return value
+
+        return TextField.python_value(self, value)
+
+
+class BaseModel(Model):
     class Meta:
         database = database_proxy
 
@@ -33,10 +342,23 @@ class Job(BaseModel):
     active = BooleanField(default=True)
     mode = TextField(default='c')
     input = TextField(null=True)
-    input_parameters = TextField(null=True)
+    input_parameters = ParamsField(null=True)
     output = TextField(null=True)
-    output_parameters = TextField(null=True)
+    output_parameters = ParamsField(null=True)
     priority = IntegerField(default=1)
+    # Incremented on each save, from the highest one of all jobs (change marker)
+    revision = IntegerField(default=0, index=True)
+
+    class Meta:
+        indexes = (
+            # Listed by (priority, id): the id is in every index
+            (('priority',), False),
+            # Filters of Reader.list_jobs()
+            (('active', 'priority'), False),
+            (('mode', 'priority'), False),
+            (('input', 'priority'), False),
+            (('output', 'priority'), False),
+            )
 
 
 class Hook(BaseModel):
@@ -49,6 +371,11 @@ class Hook(BaseModel):
     priority = IntegerField(default=1)
     job = ForeignKeyField(Job)
 
+    class Meta:
+        indexes = (
+            (('job', 'priority'), False),
+            )
+
 
 class Field(BaseModel):
     date_entered = DateTimeField(default=datetime.datetime.now)
@@ -56,6 +383,11 @@ class Field(BaseModel):
     output = TextField(null=True)
     job = ForeignKeyField(Job)
 
+    class Meta:
+        indexes = (
+            (('job', 'output'), False),
+            )
+
 
 class Rule(BaseModel):
     date_entered = DateTimeField(default=datetime.datetime.now)
@@ -63,7 +395,68 @@ class Rule(BaseModel):
     description = CharField(null=True)
     active = BooleanField(default=True)
     method = CharField()
-    params = TextField(null=True)
+    params = ParamsField(null=True)
     blocking = BooleanField(default=False)
     priority = IntegerField(default=1)
     field = ForeignKeyField(Field)
+
+    class Meta:
+        indexes = (
+            (('field', 'priority'), False),
+            )
+
+
+class JobSnapshot(BaseModel):
+    """A job with its hooks, fields and rules, as encoded by compiled.encode_job()
+    with the codec of the DB. Written with the job when job.snapshots is enabled
+    in the config"""
+    name = CharField(primary_key=True)
+    job = ForeignKeyField(Job, unique=True)
+    revision = IntegerField()
+    # Format of data, see compiled.SNAPSHOT_VERSION
+    version = IntegerField()
+    # Binary with a binary codec
+    data = ParamsField()
+
+
+class JobSearch(FTS5Model):
+    """Full text index of the jobs, kept up to date by the Writer (see update_search_index()).
+    Only created if SQLite has FTS5"""
+    name = SearchField()
+    description = SearchField()
+    # Inputs and outputs of the fields
+    fields = SearchField()
+    # Names, methods and descriptions of the rules
+    rules = SearchField()
+
+    class Meta:
+        database = database_proxy
+        # Keep identifiers such as field_name as one word
+        options = {'tokenize': "unicode61 tokenchars '_'"}
+
+
+class DeletedJob(BaseModel):
+    """Jobs deleted by the Writer, with the revision of the deletion: readers that
+    follow the revisions (see Scheduler.refresh()) see deletions too. A job id can
+    be reused by a new job, with a higher revision"""
+    job_id = IntegerField()
+    revision = IntegerField(index=True)
+
+
+class Setting(BaseModel):
+    """Values kept in the DB by name, shared by all the processes using it"""
+    name = CharField(primary_key=True)
+    value = TextField()
+
+
+def next_revision() -> int:
+    """The revision for a change: the highest one of the jobs and the deletions + 1.
+    To call once the DB is locked (something written in the transaction)"""
+
+    revisions = (Job.select(fn.MAX(Job.revision).alias('revision'))
+                 | DeletedJob.select(fn.MAX(DeletedJob.revision).alias('revision')))
+
+    return max(revision or 0 for revision, in revisions.tuples()) + 1
+
+
+MODELS = (Job, Hook, Field, Rule, JobSnapshot, DeletedJob, Setting)
@@ -0,0 +1,274 @@
+import functools
+import time
+
+from .compiled import CompiledJob
+
+
+class MethodRegistry():
+    """Callables used by rules (and hooks), by method name. Register them with
+    registry.register('uppercase', str.upper) or as a decorator:
+
+        @registry.register('trim')
+        def trim(value, chars=None):
+            return value.strip(chars)
+
+    A rule method can also have a vectorized version, that gets a whole column
+    (list, NumPy array...) and returns the transformed column. It's used by
+    Pipeline.transform_columns(). When the vectorized one fails, the scalar one
+    is applied row by row, unless fallback is False (then the whole column fails):
+
+        registry.register('uppercase', str.upper, vectorized=numpy.char.upper)
+    """
+
+    def __init__(self, methods: dict = None, vectorized: dict = None):
+        self._methods = dict(methods or {})
+        self._vectorized = dict(vectorized or {})
+        # Names of the vectorized methods that can fall back to the scalar ones
+        self._fallbacks = set()
+
+
+    def register(self, name: str, method=None, vectorized=None, fallback: bool = True):
+        if method is None:
+            return lambda method: self.register(name, method, vectorized, fallback)
+
+        if not callable(method):
+            raise ValueError('The method {} must be callable'.format(name))
+
+        self._methods[name] = method
+        if vectorized is not None:
+            self.register_vectorized(name, vectorized, fallback)
+
+        return method
+
+
+    def register_vectorized(self, name: str, method=None, fallback: bool = True):
+        if method is None:
+            return lambda method: self.register_vectorized(name, method, fallback)
+
+        if not callable(method):
+            raise ValueError('The vectorized method {} must be callable'.format(name))
+
+        self._vectorized[name] = method
+        if fallback:
+            self._fallbacks.add(name)
+        else:
+            self._fallbacks.discard(name)
+
+        return method
+
+
+    def get(self, name: str):
+        if name not in self._methods:
+            raise KeyError('The method {} is not registered'.format(name))
+
+        return self._methods[name]
+
+
+    def get_vectorized(self, name: str):
+        """Get the vectorized version of a method, None if it has none"""
+
+        return self._vectorized.get(name)
+
+
+    def has_fallback(self, name: str) -> bool:
+        """Can the scalar method be applied row by row when the vectorized one fails"""
+
+        return name in self._fallbacks
+
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._methods
+
+
+# Used when no registry is given to compile_pipeline()
+default_registry = MethodRegistry()
+
+
+class RuleError(Exception):
+    """A blocking rule failed: the record can't be transformed. For a batch
+    of columns, row is the index of the failing record"""
+
+    def __init__(self, output: str, rule: str, error: Exception, row: int = None):
+        message = "Rule '{}' of field '{}' failed ({})".format(rule, output, error)
+        if row is not None:
+            message = 'Row {}: {}'.format(row, message)
+
+        Exception.__init__(self, message)
+        self.output = output
+        self.rule = rule
+        self.error = error
+        self.row = row
+
+
+class Pipeline():
+    """Executable version of a job's fields: for each field, a tuple of resolved
+    rule callables (params bound, ordered by priority, inactive rules dropped).
+    Built once per job load, then applied to each record with transform()"""
+
+    def __init__(self, job: CompiledJob, fields: tuple):
+        self.job = job
+        # (input, output, steps) with steps a tuple of
+        # (rule name, callable, vectorized callable or None, fallback, blocking)
+        self.fields = fields
+
+
+    def transform(self, record: dict, errors: list = None) -> dict:
+        """Map a record (dict by input field) to a dict by output field. A blocking rule
+        that fails raises a RuleError. A non blocking one is skipped (the value is kept)
+        and, if a list is given, (output, rule name, exception) is appended to errors"""
+
+        data = dict()
+        for input, output, steps in self.fields:
+            value = record.get(input)
+            for name, func, vectorized, fallback, blocking in steps:
+                try:
+                    value = func(value)
+                except Exception as e:
+                    if blocking:
+                        raise RuleError(output, name, e) from e
+                    if errors is not None:
+                        errors.append((output, name, e))
+
+            data[output] = value
+
+        return data
+
+
+    def transform_columns(self, columns: dict, errors: list = None) -> dict:
+        """Same as transform() for a batch of records stored by column: a dict of
+        lists (or NumPy arrays) by input field, all of the same length. Returns a
+        dict of columns by output field.
+
+        Rules with a vectorized method get the whole column. If it fails, (output,
+        rule name, exception, None) is appended to errors. Then the rule is applied
+        row by row if its method has a fallback (the default, see MethodRegistry), else
+        the whole column fails: a RuleError for a blocking rule, or the column is kept.
+
+        Rules without a vectorized method are applied row by row: a failing row raises
+        a RuleError for a blocking rule, else it's skipped and (output, rule name,
+        exception, row) is appended to errors"""
+
+        size = len(next(iter(columns.values()))) if len(columns) > 0 else 0
+
+        data = dict()
+        for input, output, steps in self.fields:
+            column = columns.get(input)
+            if column is None:
+                column = [None] * size
+
+            for name, func, vectorized, fallback, blocking in steps:
+                if vectorized is not None:
+                    try:
+                        column = vectorized(column)
+                        continue
+                    except Exception as e:
+                        if blocking and fallback is False:
+                            raise RuleError(output, name, e) from e
+                        if errors is not None:
+                            errors.append((output, name, e, None))
+                        if fallback is False:
+                            continue
+
+                column = self._apply_rows(column, output, name, func, blocking, errors)
+
+            data[output] = column
+
+        return data
+
+
+    def _apply_rows(self, column, output: str, name: str, func, blocking: bool, errors: list) -> list:
+        values = list()
+        for row, value in enumerate(column):
+            try:
+                value = func(value)
+            except Exception as e:
+                if blocking:
+                    raise RuleError(output, name, e, row) from e
+                if errors is not None:
+                    errors.append((output, name, e, row))
+
+            values.append(value)
+
+        return values
+
+
+class HookDispatcher():
+    """Hooks of a job by stage (when), resolved once per job load: for each stage,
+    the callables of the active hooks ordered by priority. If timings is True, the
+    number of calls and time spent per stage are kept in self.timings"""
+
+    def __init__(self, job: CompiledJob, hooks: dict, timings: bool = False):
+        self.job = job
+        # when -> tuple of callables
+        self.hooks = hooks
+        # when -> [calls, seconds]
+        self.timings = dict() if timings else None
+
+
+    def fire(self, when: str, context: dict = None) -> None:
+        """Call the hooks of a stage with the context"""
+
+        hooks = self.hooks.get(when)
+        if hooks is None:
+            return
+
+        if self.timings is None:
+            for hook in hooks:
+                hook(context)
+            return
+
+        start = time.perf_counter()
+        try:
+            for hook in hooks:
+                hook(context)
+        finally:
+            timing = self.timings.setdefault(when, [0, 0.0])
+            timing[0] += 1
+            timing[1] += time.perf_counter() - start
+
+
+    def __contains__(self, when: str) -> bool:
+        return when in self.hooks
+
+
+def compile_hooks(job: CompiledJob, registry: MethodRegistry = None, timings: bool = False) -> HookDispatcher:
+    """Resolve the hooks of a compiled job with a registry (see compile_pipeline())"""
+
+    registry = registry or default_registry
+
+    hooks = dict()
+    for hook in job.hooks:
+        if hook.active:
+            hooks.setdefault(hook.when, list()).append(registry.get(hook.method))
+
+    return HookDispatcher(job, dict((when, tuple(methods)) for when, methods in hooks.items()), timings)
+
+
+def compile_pipeline(job: CompiledJob, registry: MethodRegistry = None) -> Pipeline:
+    """Resolve the rules of a compiled job (see Reader.get_compiled()) with a registry.
+    Raises a KeyError if an active rule uses a method that is not registered"""
+
+    registry = registry or default_registry
+
+    fields = tuple(
+        (field.input, field.output, tuple(
+            (rule.name, bind(registry.get(rule.method), rule.params),
+             bind(registry.get_vectorized(rule.method), rule.params),
+             registry.has_fallback(rule.method), rule.blocking)
+            for rule in field.rules if rule.active))
+        for field in job.fields)
+
+    return Pipeline(job, fields)
+
+
+def bind(method, params):
+    """Bind the params of a rule: a list is passed as positional arguments,
+    a dict as keyword arguments"""
+
+    if method is None or params is None or len(params) == 0:
+        return method
+
+    if isinstance(params, dict):
+        return functools.partial(method, **params)
+
+    return functools.partial(method, *params)
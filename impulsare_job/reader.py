@@ -1,70 +1,402 @@
-import json
+import copy
+import sys
 
+from collections import OrderedDict
+from peewee import OperationalError
+from .compiled import SNAPSHOT_VERSION, CompiledJob, compile_job, decode_job
 from .db import Db
-from .models import Field, Job, Hook, Rule
+from .models import Field, Job, JobSearch, JobSnapshot, Hook, ParamsField, Rule, SQLITE_MAX_VARIABLES
+from .models import check_search_index, has_search
+from .pipeline import HookDispatcher, MethodRegistry, Pipeline, compile_hooks, compile_pipeline
+from .serializers import decode
+
+
+def get_prefix_end(prefix: str):
+    """The first string after all the ones starting with prefix, None if there's
+    none (prefix made of the highest code point only)"""
+
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if prefix == '':
+        return None
+
+    code = ord(prefix[-1]) + 1
+    # Surrogates can't be encoded in UTF-8
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000
+
+    return prefix[:-1] + chr(code)
 
 
 class Reader(Db):
     """Simple reader to get data from an SQLite DB"""
 
-    def __init__(self, config_file: str, job: str):
+    def __init__(self, config_file: str, job: str, use_cache: bool = True):
+        """Get a job from the cache (see job.cache in the config) if it's enabled
+        and use_cache is True. Cached jobs are shared: don't modify them"""
+
         Db.__init__(self, config_file)
+        if use_cache is True and self._cache is not None:
+            self._init_from_cache(job)
+            return
+
         try:
-            self._job = Job.get(Job.name == job)
+            job = Job.get(Job.name == job)
         except Exception:
             raise ValueError("Can't retrieve Job {}".format(job))
 
-        self._job.input_parameters = self._convert_json(self._job.input_parameters)
-        self._job.output_parameters = self._convert_json(self._job.output_parameters)
+        self._set_job(job)
+
+
+    @classmethod
+    def load_many(cls, config_file: str, names: list, columns: list = None) -> OrderedDict:
+        """Get Readers for a list of jobs, with their hooks, fields and rules,
+        in 4 queries (per batch of 999 jobs). Returns them by name, in the same order.
+        If columns are given, only these columns of the jobs are read (see _load())"""
+
+        db = Db(config_file)
+        readers = dict()
+        for i in range(0, len(names), SQLITE_MAX_VARIABLES):
+            readers.update(cls._load(db, Job.name << names[i:i + SQLITE_MAX_VARIABLES], columns))
+
+        missing = [name for name in names if name not in readers]
+        if len(missing) > 0:
+            raise ValueError("Can't retrieve Job(s) {}".format(', '.join(missing)))
+
+        return OrderedDict((name, readers[name]) for name in names)
+
+
+    @classmethod
+    def load_active(cls, config_file: str, columns: list = None) -> OrderedDict:
+        """Get Readers for all active jobs, ordered by priority, with their
+        hooks, fields and rules, in 4 queries. Returns them by name"""
+
+        return cls._load(Db(config_file), Job.active == True, columns)  # noqa: E712
+
+
+    @classmethod
+    def load_compiled(cls, config_file: str, names: list) -> OrderedDict:
+        """Same as load_many() but returns read only CompiledJob"""
+
+        readers = cls.load_many(config_file, names)
+
+        return OrderedDict((name, reader.get_compiled()) for name, reader in readers.items())
+
+
+    @classmethod
+    def load_snapshot(cls, config_file: str, name: str) -> CompiledJob:
+        """Get a job as a CompiledJob from its snapshot: a single row read by primary key
+        (see job.snapshots in the config). Falls back to the tables if it has none"""
+
+        db = Db(config_file)
+        db._use_db()
+        snapshot = (JobSnapshot.select(JobSnapshot.version, JobSnapshot.data)
+                    .where(JobSnapshot.name == name).tuples().first())
+        if snapshot is not None and snapshot[0] == SNAPSHOT_VERSION:
+            return decode_job(snapshot[1])
+
+        return cls(config_file, name).get_compiled()
+
+
+    @classmethod
+    def list_jobs(cls, config_file: str, columns: list = ('id', 'name', 'priority', 'active'),
+                  active: bool = None, mode: str = None, input: str = None, output: str = None,
+                  min_priority: int = None, max_priority: int = None, prefix: str = None,
+                  after: tuple = None, limit: int = None, dicts: bool = False, page_size: int = 1000):
+        """Generator on jobs ordered by (priority, id), as tuples of the columns asked for
+        (or dicts). Only these columns are read, page by page.
+        Filters are combined, prefix is the beginning of the name. To get the next
+        page, give the (priority, id) of the last job received as after"""
+
+        for column in columns:
+            if column not in Job._meta.fields:
+                raise ValueError('{} is not a valid job column'.format(column))
+
+        db = Db(config_file)
+        db._use_db()
+
+        where = list()
+        for column, value in (('active', active), ('mode', mode), ('input', input), ('output', output)):
+            if value is not None:
+                where.append(Job._meta.fields[column] == value)
+        if min_priority is not None:
+            where.append(Job.priority >= min_priority)
+        if max_priority is not None:
+            where.append(Job.priority <= max_priority)
+        if prefix is not None and prefix != '':
+            # A range on the name uses its index, LIKE doesn't (case insensitive)
+            where.append(Job.name >= prefix)
+            end = get_prefix_end(prefix)
+            if end is not None:
+                where.append(Job.name < end)
+
+        # priority and id are added at the end, for the next page
+        fields = [Job._meta.fields[column] for column in columns] + [Job.priority, Job.id]
+        size = len(columns)
+        params = set(i for i, field in enumerate(fields[:size]) if isinstance(field, ParamsField))
+        while limit is None or limit > 0:
+            query = Job.select(*fields).order_by(Job.priority, Job.id)
+            conditions = list(where)
+            if after is not None:
+                conditions.append((Job.priority > after[0]) | ((Job.priority == after[0]) & (Job.id > after[1])))
+            if len(conditions) > 0:
+                query = query.where(*conditions)
+
+            page = min(page_size, limit) if limit is not None else page_size
+            rows = list(query.limit(page).tuples())
+            for row in rows:
+                values = row[:size]
+                if len(params) > 0:
+                    values = tuple(decode(value) if i in params else value for i, value in enumerate(values))
+
+                yield dict(zip(columns, values)) if dicts else values
+
+            if len(rows) < page:
+                return
+
+            after = rows[-1][size:]
+            if limit is not None:
+                limit -= len(rows)
+
+
+    @classmethod
+    def search(cls, config_file: str, query: str, limit: int = 20) -> list:
+        """Full text search (FTS5 query syntax) in the names and descriptions of the jobs,
+        the inputs and outputs of their fields and the names, methods and descriptions of
+        their rules. Returns (job name, score) tuples, the best matches first"""
+
+        db = Db(config_file)
+        if has_search() is False:
+            raise RuntimeError('The search needs SQLite with FTS5')
+
+        db._use_db()
+        # Jobs saved by a process without FTS5 since the DB was opened
+        check_search_index(db._db)
+
+        # Matches in the name count more
+        score = JobSearch.bm25(4.0, 1.0, 2.0, 2.0)
+        rows = (JobSearch.select(JobSearch.name, score)
+                .where(JobSearch.match(query))
+                .order_by(score)
+                .limit(limit)
+                .tuples())
+        try:
+            return [(name, -score) for name, score in rows]
+        except OperationalError as e:
+            raise ValueError('{} is not a valid search ({})'.format(query, e))
 
 
     def get_job(self) -> Job:
-        """Get the retrieved Job"""
+        """Get the retrieved Job, with all its columns (read now if only some were loaded)"""
 
-        return self._job
+        return self._get_full_job()
 
 
     def get_hooks(self):
         """Get hooks in DB For the current job"""
-        # Make sure I have the table created
-        # TODO create the tables in another way
-        Hook()
+        if self._hooks is not None:
+            return self._hooks
 
+        self._use_db()
         return Hook.select().where(Hook.job == self._job.id).order_by(Hook.priority)
 
 
     def get_fields(self):
         """Get rules in DB For the current job"""
-        # Make sure I have the table created
-        # TODO create the tables in another way
-        Field()
+        if self._fields is not None:
+            return self._fields
 
-        fields = Field.select().where(Field.job == self._job.id).order_by(Field.output)
+        self._use_db()
+        fields = list(Field.select().where(Field.job == self._job.id).order_by(Field.output, Field.id))
+        rules = self._get_rules_by_field(Field.job == self._job.id)
         for field in fields:
-            field.rules = self._get_rules(field.id)
+            field.rules = rules.get(field.id, [])
 
         return fields
 
 
+    def iter_fields(self, batch_size: int = 500):
+        """Generator on the fields of the current job, with their rules, read by batch
+        to keep a constant memory whatever the number of fields. Same order as get_fields().
+        Fields already loaded with the job (load_many(), load_active()) are not read again,
+        the ones of the cache are: they can be outdated"""
+
+        if self._fields is not None and self._from_cache is False:
+            for field in self._fields:
+                yield field
+            return
+
+        self._use_db()
+        batch_size = max(1, min(batch_size, SQLITE_MAX_VARIABLES))
+        query = Field.select().where(Field.job == self._job.id).order_by(Field.output, Field.id)
+
+        batch = list()
+        for field in query.iterator():
+            batch.append(field)
+            if len(batch) == batch_size:
+                for field in self._attach_rules(batch):
+                    yield field
+                batch = list()
+
+        for field in self._attach_rules(batch):
+            yield field
+
+
+    def get_compiled(self) -> CompiledJob:
+        """Get the job with its hooks, fields and rules as a read only CompiledJob"""
+
+        return compile_job(self._get_full_job(), self.get_hooks(), self.get_fields())
+
+
+    def get_pipeline(self, registry: MethodRegistry = None) -> Pipeline:
+        """Get the fields with their rules resolved by the registry, to transform records"""
+
+        return compile_pipeline(self.get_compiled(), registry)
+
+
+    def get_dispatcher(self, registry: MethodRegistry = None, timings: bool = False) -> HookDispatcher:
+        """Get the active hooks by stage (when), resolved by the registry"""
+
+        return compile_hooks(self.get_compiled(), registry, timings)
+
+
     def get_prop(self, prop: str):
+        if self._columns is not None and prop not in self._columns:
+            return getattr(self._get_full_job(), prop)
+
         return getattr(self._job, prop)
 
 
-    def _get_rules(self, field_id: int):
-        """Get rules in DB For the current job"""
-        # Make sure I have the table created
-        # TODO create the tables in another way
-        Rule()
+    @classmethod
+    def _load(cls, db: Db, where, columns: list = None) -> OrderedDict:
+        """Load jobs matching a condition with everything related, in 4 queries.
+        With a list of columns, only these ones (plus id, name and revision) are
+        read, in 1 query: hooks, fields and the other columns are read when they
+        are asked for"""
 
-        rules = Rule.select().where(Rule.field == field_id).order_by(Rule.priority)
-        for rule in rules:
-            rule.params = self._convert_json(rule.params)
+        if columns is not None:
+            return cls._load_columns(db, where, columns)
+
+        jobs_ids = Job.select(Job.id).where(where)
+
+        hooks = dict()
+        query = Hook.select().where(Hook.job << jobs_ids).order_by(Hook.job, Hook.priority, Hook.id)
+        for hook in query:
+            hooks.setdefault(hook.job_id, []).append(hook)
+
+        fields = dict()
+        rules = cls._get_rules_by_field(Field.job << jobs_ids)
+        query = Field.select().where(Field.job << jobs_ids).order_by(Field.job, Field.output, Field.id)
+        for field in query:
+            field.rules = rules.get(field.id, [])
+            fields.setdefault(field.job_id, []).append(field)
+
+        readers = OrderedDict()
+        for job in Job.select().where(where).order_by(Job.priority, Job.id):
+            readers[job.name] = cls._new(db, job, hooks.get(job.id, []), fields.get(job.id, []))
+
+        return readers
+
+
+    @classmethod
+    def _load_columns(cls, db: Db, where, columns: list) -> OrderedDict:
+        for column in columns:
+            if column not in Job._meta.fields:
+                raise ValueError('{} is not a valid job column'.format(column))
+
+        names = OrderedDict.fromkeys(['id', 'name', 'revision'] + list(columns))
+        fields = [Job._meta.fields[name] for name in names]
+
+        readers = OrderedDict()
+        for job in Job.select(*fields).where(where).order_by(Job.priority, Job.id):
+            reader = cls._new(db, job)
+            reader._columns = tuple(names)
+            readers[job.name] = reader
+
+        return readers
+
+
+    @classmethod
+    def _new(cls, db: Db, job: Job, hooks: list = None, fields: list = None):
+        """A Reader sharing the config and DB of db, for an already loaded job"""
+
+        reader = cls.__new__(cls)
+        Db.__init__(reader, db)
+        reader._set_job(job, hooks, fields)
 
-        return rules
+        return reader
 
 
-    def _convert_json(self, jsonstr: str):
-        if jsonstr == '':
-            return {}
+    def _init_from_cache(self, name: str) -> None:
+        def get_revision():
+            return Job.select(Job.revision).where(Job.name == name).scalar()
+
+        data = self._cache.get(name, get_revision)
+        if data is None:
+            readers = self._load(self, Job.name == name)
+            if name not in readers:
+                raise ValueError("Can't retrieve Job {}".format(name))
+
+            reader = readers[name]
+            data = (reader._job, reader._hooks, reader._fields)
+            self._cache.set(name, reader._job.revision, data)
+
+        # A copy: the cached models stay as they are in DB whatever the readers do with theirs
+        self._job, self._hooks, self._fields = copy.deepcopy(data)
+        self._from_cache = True
+        self._columns = None
+
+
+    def _attach_rules(self, fields: list) -> list:
+        if len(fields) == 0:
+            return fields
+
+        rules = self._get_rules_by_field(Field.id << [field.id for field in fields])
+        for field in fields:
+            field.rules = rules.get(field.id, [])
+
+        return fields
+
+
+    def _set_job(self, job: Job, hooks: list = None, fields: list = None) -> None:
+        """Set the job, with its hooks and fields if they have been loaded already"""
+
+        self._job = job
+        self._hooks = hooks
+        self._fields = fields
+        self._from_cache = False
+        # Columns read for the job, None for all
+        self._columns = None
+
+
+    def _get_full_job(self) -> Job:
+        """The job with all its columns: read again if only some were loaded, the
+        other ones would be None"""
+
+        if self._columns is None:
+            return self._job
+
+        self._use_db()
+        job = Job.get_or_none(Job.id == self._job.id)
+        if job is None:
+            raise ValueError("Can't retrieve Job {}".format(self._job.name))
+
+        self._job = job
+        self._columns = None
+
+        return self._job
+
+
+    @classmethod
+    def _get_rules_by_field(cls, where) -> dict:
+        """Get all rules in DB for the fields matching a condition, in one query, grouped by field id"""
+        rules = (Rule.select(Rule)
+                 .join(Field)
+                 .where(where)
+                 # Follows the indexes (job, output) on Field then (field, priority) on Rule: no sort needed
+                 .order_by(Field.job, Field.output, Field.id, Rule.priority, Rule.id))
+
+        rules_by_field = dict()
+        for rule in rules:
+            rules_by_field.setdefault(rule.field_id, []).append(rule)
 
-        return json.loads(jsonstr)
+        return rules_by_field
@@ -0,0 +1,153 @@
+import itertools
+import multiprocessing
+import os
+import queue
+
+from collections import deque
+
+from .compiled import CompiledJob
+from .pipeline import MethodRegistry, RuleError, compile_hooks, compile_pipeline, default_registry
+from .reader import Reader
+
+
+# Pipeline of the worker process, compiled once by _init_worker()
+_pipeline = None
+
+
+def _init_worker(job: CompiledJob, registry: MethodRegistry) -> None:
+    global _pipeline
+    _pipeline = compile_pipeline(job, registry)
+
+
+def _transform_chunk(chunk: tuple) -> tuple:
+    """Transform the records of a chunk: (offset, records) -> (offset, records, errors).
+    Rejected records are replaced by None"""
+
+    offset, records = chunk
+    transformed = list()
+    errors = list()
+    for i, record in enumerate(records):
+        record_errors = list()
+        try:
+            transformed.append(_pipeline.transform(record, record_errors))
+        except RuleError as e:
+            transformed.append(None)
+            errors.append((offset + i, e.output, e.rule, str(e.error), True))
+
+        errors.extend((offset + i, output, rule, str(error), False) for output, rule, error in record_errors)
+
+    return offset, transformed, errors
+
+
+class Runner():
+    """Run a job on a stream of records (dicts by input field) with a pool of processes.
+    The job is loaded once, its CompiledJob is sent to each process that compiles its
+    pipeline, then the records are sent by chunk.
+
+    Rule and hook methods must be picklable (functions defined at module level) when
+    processes are not forked. With processes=0 the records are transformed in the
+    current process. With timings, the time spent in hooks is in self.hooks.timings.
+
+    At most max_pending chunks (2 per process by default) are sent to the processes
+    at a time: records are read as the transformed ones are consumed"""
+
+    def __init__(self, config_file: str, job: str, registry: MethodRegistry = None,
+                 processes: int = None, chunk_size: int = 1000, ordered: bool = True, timings: bool = False,
+                 max_pending: int = None):
+        self.job = Reader(config_file, job).get_compiled()
+        self.registry = registry or default_registry
+        self.processes = os.cpu_count() if processes is None else processes
+        self.chunk_size = chunk_size
+        self.max_pending = max(1, 2 * self.processes if max_pending is None else max_pending)
+        self.ordered = ordered
+        # (record index, output field, rule name, error message, blocking)
+        self.errors = list()
+        self.processed = 0
+        self.rejected = 0
+
+        self.hooks = compile_hooks(self.job, self.registry, timings)
+
+        # Fail now if a rule method is missing
+        compile_pipeline(self.job, self.registry)
+
+
+    def run(self, records):
+        """Generator on the transformed records (dicts by output field). Records rejected by a
+        blocking rule are skipped, see self.errors. If ordered is False, records are yielded
+        as soon as their chunk is done. Hooks are called with a dict as context at
+        'before_process' and 'after_process'"""
+
+        self.errors = list()
+        self.processed = 0
+        self.rejected = 0
+
+        self.hooks.fire('before_process', {'job': self.job})
+
+        chunks = self._get_chunks(records)
+        if self.processes == 0:
+            _init_worker(self.job, self.registry)
+            yield from self._collect(map(_transform_chunk, chunks))
+        else:
+            with multiprocessing.Pool(self.processes, _init_worker, (self.job, self.registry)) as pool:
+                yield from self._collect(self._imap(pool, chunks))
+
+        self.hooks.fire('after_process', {'job': self.job, 'processed': self.processed,
+                                          'rejected': self.rejected, 'errors': self.errors})
+
+
+    def _get_chunks(self, records):
+        records = iter(records)
+        for offset in itertools.count(0, self.chunk_size):
+            chunk = tuple(itertools.islice(records, self.chunk_size))
+            if len(chunk) == 0:
+                return
+
+            yield offset, chunk
+
+
+    def _imap(self, pool, chunks):
+        """Like pool.imap() (or imap_unordered()), but a chunk is read only when one
+        of the max_pending chunks sent to the processes is done"""
+
+        # Unordered: results (or exceptions) put by the pool, as chunks are done
+        done = queue.Queue()
+        pending = deque()
+
+        def submit():
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+
+            if self.ordered:
+                pending.append(pool.apply_async(_transform_chunk, (chunk,)))
+            else:
+                pending.append(pool.apply_async(_transform_chunk, (chunk,), callback=done.put,
+                                                error_callback=done.put))
+
+        for i in range(self.max_pending):
+            submit()
+
+        while len(pending) > 0:
+            if self.ordered:
+                result = pending.popleft().get()
+            else:
+                pending.pop()
+                result = done.get()
+                if isinstance(result, BaseException):
+                    raise result
+
+            # Keep the processes busy while the result is consumed
+            submit()
+            yield result
+
+
+    def _collect(self, results):
+        for offset, transformed, errors in results:
+            self.errors.extend(errors)
+            for record in transformed:
+                self.processed += 1
+                if record is None:
+                    self.rejected += 1
+                    continue
+
+                yield record
@@ -0,0 +1,142 @@
+import heapq
+
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .compiled import CompiledJob
+from .db import Db
+from .models import DeletedJob, Job
+from .reader import Reader
+
+
+class Scheduler(Db):
+    """Run the active jobs by priority (lowest first) with a pool of workers.
+    run_job(job) is called for each job, with the job as a CompiledJob.
+
+    limits is the maximum of jobs running at the same time for an input or an output,
+    for example: {'input': {'csv': 2}, 'output': {'rest': 1}}
+
+    Jobs are kept in memory, in a heap. The first refresh loads all jobs, then only
+    the jobs saved and deleted (DeletedJob) since the previous one are read, by revision"""
+
+    def __init__(self, config_file: str, run_job, workers: int = 4, limits: dict = None):
+        Db.__init__(self, config_file)
+
+        limits = limits or {}
+        for prop, values in limits.items():
+            if prop not in ('input', 'output'):
+                raise ValueError('{} is not a valid limit (input - output)'.format(prop))
+            for value, limit in values.items():
+                if type(limit) is not int or limit < 1:
+                    raise ValueError('The limit for the {} {} must be a positive integer'.format(prop, value))
+
+        self._run_job = run_job
+        self._workers = workers
+        self._limits = limits
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        # Active jobs by id, and a heap of (priority, id). Entries of jobs removed or
+        # with a new priority are left in the heap and skipped
+        self._jobs = dict()
+        self._heap = list()
+        # Highest revision seen, None until the first refresh
+        self._revision = None
+
+
+    def refresh(self) -> None:
+        """Get the changes made in DB since the last refresh"""
+
+        self._use_db()
+
+        # One read transaction: deletions and saves from the same snapshot of the DB
+        with self._db.atomic():
+            if self._revision is None:
+                # Jobs created before the revisions have the revision 0
+                deleted = list()
+                readers = Reader._load(self, Job.revision >= 0)
+                self._revision = 0
+            else:
+                deleted = list(DeletedJob.select(DeletedJob.job_id, DeletedJob.revision)
+                               .where(DeletedJob.revision > self._revision).tuples())
+                readers = Reader._load(self, Job.revision > self._revision)
+
+        # Deleted before a job reuses the id (higher revision)
+        for job_id, revision in deleted:
+            self._revision = max(self._revision, revision)
+            self._jobs.pop(job_id, None)
+
+        for reader in readers.values():
+            job = reader.get_compiled()
+            self._revision = max(self._revision, job.revision)
+            previous = self._jobs.pop(job.id, None)
+            if job.active is False:
+                continue
+
+            self._jobs[job.id] = job
+            if previous is None or previous.priority != job.priority:
+                heapq.heappush(self._heap, (job.priority, job.id))
+
+
+    def get_queue(self) -> list:
+        """Get the active jobs, in the order they are dispatched"""
+
+        self._compact()
+
+        return [self._jobs[id] for priority, id in sorted(self._heap)]
+
+
+    def run(self) -> OrderedDict:
+        """Refresh the jobs then run each active one, waiting for all of them.
+        Returns the Futures of run_job() by job name, in the order jobs were started"""
+
+        self.refresh()
+        self._compact()
+
+        pending = list(self._heap)
+        running = dict()
+        futures = OrderedDict()
+        while len(pending) > 0 or len(running) > 0:
+            blocked = list()
+            while len(pending) > 0 and len(running) < self._workers:
+                entry = heapq.heappop(pending)
+                job = self._jobs[entry[1]]
+                if self._is_limited(job, running.values()):
+                    blocked.append(entry)
+                    continue
+
+                future = self._executor.submit(self._run_job, job)
+                running[future] = job
+                futures[job.name] = future
+
+            for entry in blocked:
+                heapq.heappush(pending, entry)
+
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+
+        return futures
+
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        Db.close(self)
+
+
+    def _compact(self) -> None:
+        """Remove the entries of the heap that are not valid anymore, or duplicated"""
+
+        entries = set((priority, id) for priority, id in self._heap
+                      if id in self._jobs and self._jobs[id].priority == priority)
+        self._heap = list(entries)
+        heapq.heapify(self._heap)
+
+
+    def _is_limited(self, job: CompiledJob, running) -> bool:
+        for prop, values in self._limits.items():
+            value = getattr(job, prop)
+            if value not in values:
+                continue
+
+            if sum(1 for other in running if getattr(other, prop) == value) >= values[value]:
+                return True
+
+        return False
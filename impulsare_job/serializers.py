@@ -0,0 +1,124 @@
+import json
+import math
+
+
+# Used when the config has no job.codec
+DEFAULT_CODEC = 'json'
+
+
+class JsonCodec():
+    """JSON text, readable by any tool (the default)"""
+
+    name = 'json'
+    tag = None
+
+    def encode(self, value) -> str:
+        return json.dumps(value)
+
+
+class OrjsonCodec():
+    """JSON text too, written (and read) faster by orjson"""
+
+    name = 'orjson'
+    tag = None
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+
+    def encode(self, value) -> str:
+        # orjson writes NaN and Infinity as null: written as the json codec does instead
+        if _has_non_finite(value):
+            return json.dumps(value)
+
+        return self._orjson.dumps(value, option=self._orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+
+class MsgpackCodec():
+    """Binary: msgpack, compact and fast to decode"""
+
+    name = 'msgpack'
+    tag = b'\x01'
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+
+    def encode(self, value) -> bytes:
+        return self.tag + self._msgpack.packb(value, use_bin_type=True)
+
+
+    def decode(self, data: bytes):
+        return self._msgpack.unpackb(data[1:], raw=False, strict_map_key=False)
+
+
+CODECS = dict((codec.name, codec) for codec in (JsonCodec, OrjsonCodec, MsgpackCodec))
+
+# Binary codecs by tag (first byte of the data), created when first needed
+_binary_codecs = dict()
+
+
+def get_codec(name: str = None):
+    """Get the codec used to write parameters (see job.codec in the config)"""
+
+    name = name or DEFAULT_CODEC
+    if name not in CODECS:
+        raise ValueError('{} is not a valid codec ({})'.format(name, ' - '.join(sorted(CODECS))))
+
+    try:
+        return CODECS[name]()
+    except ImportError:
+        raise ValueError('The codec {} needs the package {}'.format(name, name))
+
+
+def decode(data):
+    """Decode parameters written by any codec: text is JSON, binary data
+    starts with the tag of its codec. Anything else is already decoded"""
+
+    if data is None or isinstance(data, (dict, list)):
+        return data
+
+    if isinstance(data, str):
+        if data == '':
+            return {}
+
+        return _json_loads(data)
+
+    data = bytes(data)
+    tag = data[:1]
+    if tag not in _binary_codecs:
+        codecs = [codec for codec in CODECS.values() if codec.tag == tag]
+        if len(codecs) == 0:
+            raise ValueError('Unknown codec for the data {!r}'.format(data[:10]))
+
+        _binary_codecs[tag] = codecs[0]()
+
+    return _binary_codecs[tag].decode(data)
+
+
+def _has_non_finite(value) -> bool:
+    """Is there a NaN or an infinite float in the value (nested in dicts and lists)"""
+
+    if isinstance(value, float):
+        return math.isfinite(value) is False
+    if isinstance(value, dict):
+        return any(_has_non_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(item) for item in value)
+
+    return False
+
+
+try:
+    import orjson
+
+    def _json_loads(data: str):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # json.dumps() writes NaN and Infinity, orjson doesn't read them
+            return json.loads(data)
+except ImportError:
+    _json_loads = json.loads
@@ -1,15 +1,67 @@
-import json
+import copy
 
+from .compiled import SNAPSHOT_VERSION, CompiledJob, compile_job, encode_job
 from .db import Db
 from .reader import Reader
-from .models import Field, Job, Hook, Rule
-from peewee import DeleteQuery, OperationalError
+from .models import DeletedJob, Field, Job, JobSnapshot, Hook, Rule, SQLITE_MAX_VARIABLES
+from .models import next_revision, update_search_index
+
+
+def insert_many(model, rows: list, replace: bool = False) -> None:
+    """Insert rows with multi-rows INSERT (or REPLACE), in batches small enough for SQLite"""
+    if len(rows) == 0:
+        return
+
+    batch_size = max(1, SQLITE_MAX_VARIABLES // len(model._meta.fields))
+    for i in range(0, len(rows), batch_size):
+        if replace is True:
+            model.replace_many(rows[i:i + batch_size]).execute()
+        else:
+            model.insert_many(rows[i:i + batch_size]).execute()
+
+
+def delete_many(model, column, values: list) -> None:
+    """DELETE ... WHERE column IN (...), in batches small enough for SQLite"""
+    for i in range(0, len(values), SQLITE_MAX_VARIABLES):
+        model.delete().where(column << values[i:i + SQLITE_MAX_VARIABLES]).execute()
+
+
+def finish_save(db: Db, writers: list) -> None:
+    """Last steps of a save, in its transaction, once the jobs of the writers have been
+    written with their hooks, fields and rules: one new revision for all of them, their
+    snapshots and their search index entries. Used by Writer.save() and the Importer"""
+
+    jobs_ids = [writer._job.id for writer in writers]
+
+    # Once the jobs have been written, so the DB is locked and no other process can get the same revision
+    revision = next_revision()
+    for i in range(0, len(jobs_ids), SQLITE_MAX_VARIABLES):
+        Job.update(revision=revision).where(Job.id << jobs_ids[i:i + SQLITE_MAX_VARIABLES]).execute()
+    for writer in writers:
+        writer._job.revision = revision
+
+    # Written if they are enabled (job.snapshots in the config), else removed so
+    # the Reader never gets an outdated one
+    if db._config.get('job').get('snapshots', False) is False:
+        delete_many(JobSnapshot, JobSnapshot.job, jobs_ids)
+    else:
+        snapshots = list()
+        for writer in writers:
+            job = writer._get_compiled()
+            snapshots.append({'name': job.name, 'job': job.id, 'revision': job.revision,
+                              'version': SNAPSHOT_VERSION, 'data': encode_job(job, db._codec)})
+        # Replaces the previous ones, by name or by job (renamed)
+        insert_many(JobSnapshot, snapshots, replace=True)
+
+    update_search_index(db._db, jobs_ids)
 
 
 class FieldsWriter(Db):
     def __init__(self, config_file: str, job: str = None):
         Db.__init__(self, config_file)
         self._fields = {}
+        # Fields and rules as they are in DB, with their ids, to write only what changed
+        self._saved = {}
 
 
     def add_field(self, input: str, output: str):
@@ -20,25 +72,64 @@ class FieldsWriter(Db):
 
 
     def add_fields_to_db(self, job: Job):
-        # First delete all rules linked ot fields + fields
-        # to avoid spending too much time updating, deleting, etc ...
-        try:
-            fields = Field.select().where(Field.job == job)
-            for field in fields:
-                field.delete_instance(recursive=True)
-        except OperationalError as e:
-            pass
-
-        fields_added = list()
-        for field, params in self._fields.items():
-            field = Field(input=params['input'], output=params['output'], job=job)
-            field.save()
-            fields_added.append(field.id)
-
-            if params['rules'] is not {}:
-                self.add_rules_to_db(field.id, params['rules'])
-
-        return fields_added
+        """Write only the changes made since the fields have been loaded or saved"""
+
+        fields_ids = dict()
+        rules_ids = dict()
+        deleted_fields = list()
+        deleted_rules = list()
+        new_rules = list()
+        for output, saved in self._saved.items():
+            if output not in self._fields:
+                deleted_fields.append(saved['id'])
+                continue
+
+            fields_ids[output] = saved['id']
+            field = self._fields[output]
+            if field['input'] != saved['input']:
+                Field.update(input=field['input']).where(Field.id == saved['id']).execute()
+
+            for name, saved_rule in saved['rules'].items():
+                if name not in field['rules']:
+                    deleted_rules.append(saved_rule['id'])
+                    continue
+
+                rules_ids[(output, name)] = saved_rule['id']
+                rule = field['rules'][name]
+                if any(rule[prop] != saved_rule[prop] for prop in rule):
+                    Rule.update(**self._get_rule_row(name, rule)).where(Rule.id == saved_rule['id']).execute()
+
+            new_rules += [(output, name) for name in field['rules'] if name not in saved['rules']]
+
+        delete_many(Rule, Rule.field, deleted_fields)
+        delete_many(Rule, Rule.id, deleted_rules)
+        delete_many(Field, Field.id, deleted_fields)
+
+        new_fields = [output for output in self._fields if output not in self._saved]
+        insert_many(Field, [{'input': self._fields[output]['input'], 'output': output, 'job': job.id}
+                            for output in new_fields])
+        if len(new_fields) > 0:
+            # The output is unique for a job: get the ids back to link the rules
+            fields_ids = dict(Field.select(Field.output, Field.id).where(Field.job == job.id).tuples())
+            for output in new_fields:
+                new_rules += [(output, name) for name in self._fields[output]['rules']]
+
+        rules = list()
+        for output, name in new_rules:
+            rule = self._get_rule_row(name, self._fields[output]['rules'][name])
+            rule['field'] = fields_ids[output]
+            rules.append(rule)
+        insert_many(Rule, rules)
+
+        if len(new_rules) > 0:
+            outputs = dict((field_id, output) for output, field_id in fields_ids.items())
+            query = Rule.select(Rule.id, Rule.name, Rule.field).join(Field).where(Field.job == job.id)
+            for rule_id, name, field_id in query.tuples():
+                rules_ids[(outputs[field_id], name)] = rule_id
+
+        self._set_saved(fields_ids, rules_ids)
+
+        return [fields_ids[output] for output in self._fields]
 
 
     def del_field(self, output_field: str) -> None:
@@ -67,11 +158,19 @@ class FieldsWriter(Db):
 
 
     def set_fields_from_job(self, reader: Reader) -> None:
+        fields_ids = dict()
+        rules_ids = dict()
         fields = reader.get_fields()
         for field in fields:
             self.add_field(input=field.input, output=field.output)
             self.set_rules_from_field(field.output, field.rules)
 
+            fields_ids[field.output] = field.id
+            for rule in field.rules:
+                rules_ids[(field.output, rule.name)] = rule.id
+
+        self._set_saved(fields_ids, rules_ids)
+
 
     def add_rule(self, output_field: str, name: str, method: str, description: str = None,
                  active: bool = True, params: list = {}, blocking: bool = False,
@@ -89,14 +188,13 @@ class FieldsWriter(Db):
 
 
     def add_rules_to_db(self, field_id: int, rules: dict):
-        for rule, params in rules.items():
-            rule = Rule(
-                name=rule, method=params['method'], description=params['description'],
-                active=params['active'], params=json.dumps(params['params']),
-                blocking=params['blocking'], priority=params['priority'], field=field_id
-                )
+        rows = list()
+        for name, params in rules.items():
+            rule = self._get_rule_row(name, params)
+            rule['field'] = field_id
+            rows.append(rule)
 
-            rule.save()
+        insert_many(Rule, rows)
 
 
     def del_rule(self, output_field: str, rule: str) -> None:
@@ -130,10 +228,31 @@ class FieldsWriter(Db):
                           rule.active, rule.params, rule.blocking, rule.priority)
 
 
+    def _get_rule_row(self, name: str, params: dict) -> dict:
+        return {'name': name, 'method': params['method'], 'description': params['description'],
+                'active': params['active'], 'params': self._codec.encode(params['params']),
+                'blocking': params['blocking'], 'priority': params['priority']}
+
+
+    def _set_saved(self, fields_ids: dict, rules_ids: dict) -> None:
+        """Keep a copy of the current fields as they are in DB"""
+
+        self._saved = dict()
+        for output, field in self._fields.items():
+            rules = dict()
+            for name, rule in field['rules'].items():
+                rules[name] = copy.deepcopy(rule)
+                rules[name]['id'] = rules_ids[(output, name)]
+
+            self._saved[output] = {'id': fields_ids[output], 'input': field['input'], 'rules': rules}
+
+
 class HooksWriter(Db):
     def __init__(self, config_file: str, job: str = None):
         Db.__init__(self, config_file)
         self._hooks = {}
+        # Hooks as they are in DB, with their ids, to write only what changed
+        self._saved = {}
 
 
     def hook_exists(self, name: str) -> bool:
@@ -173,29 +292,49 @@ class HooksWriter(Db):
 
 
     def add_hooks_to_db(self, job: Job):
-        # First delete all hooks to avoid spending too much time
-        # updating, deleting, etc ...
-        try:
-            DeleteQuery(Hook).where(Hook.job == job.id).execute()
-        except OperationalError as e:
-            pass
+        """Write only the changes made since the hooks have been loaded or saved"""
 
-        hooks_added = list()
-        for hook, params in self._hooks.items():
-            hook = Hook(name=hook, when=params['when'], method=params['method'],
-                        priority=params['priority'], description=params['description'],
-                        active=params['active'], job=job)
-            hook.save()
-            hooks_added.append(hook.id)
+        hooks_ids = dict()
+        deleted_hooks = list()
+        for name, saved in self._saved.items():
+            if name not in self._hooks:
+                deleted_hooks.append(saved['id'])
+                continue
 
-        return hooks_added
+            hooks_ids[name] = saved['id']
+            hook = self._hooks[name]
+            if any(hook[prop] != saved[prop] for prop in hook):
+                Hook.update(**hook).where(Hook.id == saved['id']).execute()
+
+        delete_many(Hook, Hook.id, deleted_hooks)
+
+        new_hooks = [name for name in self._hooks if name not in self._saved]
+        insert_many(Hook, [dict(self._hooks[name], job=job.id) for name in new_hooks])
+        if len(new_hooks) > 0:
+            hooks_ids = dict(Hook.select(Hook.name, Hook.id).where(Hook.job == job.id).tuples())
+
+        self._set_saved(hooks_ids)
+
+        return [hooks_ids[name] for name in self._hooks]
 
 
     def set_hooks_from_job(self, reader: Reader) -> None:
+        hooks_ids = dict()
         hooks = reader.get_hooks()
         for hook in hooks:
             self.add_hook(hook.name, hook.method, hook.when, hook.description,
                           hook.active, hook.priority)
+            hooks_ids[hook.name] = hook.id
+
+        self._set_saved(hooks_ids)
+
+
+    def _set_saved(self, hooks_ids: dict) -> None:
+        """Keep a copy of the current hooks as they are in DB"""
+
+        self._saved = dict()
+        for name, hook in self._hooks.items():
+            self._saved[name] = dict(hook, id=hooks_ids[name])
 
 
 class Writer(Db):
@@ -213,9 +352,9 @@ class Writer(Db):
             'description': None,
             'priority': 1,
             'input': None,
-            'input_parameters': {},
+            'input_parameters': self._codec.encode({}),
             'output': None,
-            'output_parameters': {},
+            'output_parameters': self._codec.encode({}),
             'mode': 'c'
             }
 
@@ -223,7 +362,8 @@ class Writer(Db):
         self.hooks_writer = HooksWriter(config_file, job)
 
         if job is not None:
-            self._reader = Reader(config_file, job)
+            # Always from the DB: the changes are computed from what's in it
+            self._reader = Reader(config_file, job, use_cache=False)
             self._job = self._reader.get_job()
             self._populate_data_from_job()
         else:
@@ -262,21 +402,46 @@ class Writer(Db):
     def save(self) -> Job:
         self._verify_required_values()
 
+        old_name = self._job.name
         for prop in self._job_props_type:
             setattr(self._job, prop, self._data[prop])
 
+        # All or nothing, and a single commit (fsync) for the whole job
+        self._use_db()
+        state = self._get_state()
         try:
-            self._job.save()
-            self.fields_writer.add_fields_to_db(self._job)
-            self.hooks_writer.add_hooks_to_db(self._job)
+            with self._db.atomic():
+                self._job.save()
+                self.fields_writer.add_fields_to_db(self._job)
+                self.hooks_writer.add_hooks_to_db(self._job)
+                finish_save(self, [self])
 
             return self._job
         except Exception as e:
+            # Nothing has been written: keep the previous state to compute the next changes
+            self._set_state(state)
+
             raise RuntimeError("Can't insert the job '{}' ({})".format(self._job.name, e))
+        finally:
+            self._invalidate_cache(old_name, self._job.name)
 
 
     def delete(self):
-        self._job.delete_instance()
+        self._use_db()
+        with self._db.atomic():
+            JobSnapshot.delete().where(JobSnapshot.job == self._job.id).execute()
+            # Foreign keys are not enforced: nothing is deleted in cascade, and a new
+            # job can get the same id
+            fields_ids = [field_id for field_id, in Field.select(Field.id).where(Field.job == self._job.id).tuples()]
+            delete_many(Rule, Rule.field, fields_ids)
+            Field.delete().where(Field.job == self._job.id).execute()
+            Hook.delete().where(Hook.job == self._job.id).execute()
+            # Before the job is deleted: it can have the highest revision
+            revision = next_revision()
+            self._job.delete_instance()
+            update_search_index(self._db, [self._job.id])
+            DeletedJob.create(job_id=self._job.id, revision=revision)
+        self._invalidate_cache(self._job.name)
 
 
     def _check_mode(self, mode: str) -> None:
@@ -284,6 +449,44 @@ class Writer(Db):
             raise ValueError('{} is not a valid mode (c - u - cu - d)'.format(mode))
 
 
+    def _get_state(self) -> tuple:
+        """What is known about the job in DB: its id and the saved fields and hooks"""
+
+        return (self._job.id, self.fields_writer._saved, self.hooks_writer._saved)
+
+
+    def _set_state(self, state: tuple) -> None:
+        """Go back to a previous state, when what has been saved since is rolled back"""
+
+        self._job.id, self.fields_writer._saved, self.hooks_writer._saved = state
+
+
+    def _invalidate_cache(self, *names) -> None:
+        """Remove the job from the cache (old and new name if it's been renamed)"""
+
+        if self._cache is None:
+            return
+
+        for name in names:
+            self._cache.invalidate(name)
+
+
+    def _get_compiled(self) -> CompiledJob:
+        """The job as it's been saved, built from what the writer knows (no query):
+        the same as Reader.get_compiled()"""
+
+        # Models not read from the DB: the encoded parameters are decoded the same way
+        hooks = [Hook(**hook) for hook in sorted(self.hooks_writer._saved.values(), key=lambda hook: hook['id'])]
+        fields = list()
+        for output, saved in sorted(self.fields_writer._saved.items()):
+            field = Field(id=saved['id'], input=saved['input'], output=output)
+            field.rules = [Rule(id=rule['id'], **self.fields_writer._get_rule_row(name, rule))
+                           for name, rule in sorted(saved['rules'].items(), key=lambda item: item[1]['id'])]
+            fields.append(field)
+
+        return compile_job(self._job, hooks, fields)
+
+
     def _parse_value(self, prop: str, value):
         if prop not in self._job_props_type:
             raise KeyError("Can't set {} as it does not exist in our dict".format(prop))
@@ -293,14 +496,19 @@ class Writer(Db):
             raise ValueError('{} must be of type {}'.format(prop, expected_type))
 
         if expected_type is dict:
-            value = json.dumps(value)
+            value = self._codec.encode(value)
 
         return value
 
 
     def _populate_data_from_job(self) -> None:
         for prop in self._job_props_type:
-            self._data[prop] = self._reader.get_prop(prop)
+            value = self._reader.get_prop(prop)
+            # Stored as set_prop() does, else they are saved as str(dict)
+            if self.get_job_prop_type(prop) is dict:
+                value = self._codec.encode(value)
+
+            self._data[prop] = value
 
         self.fields_writer.set_fields_from_job(self._reader)
         self.hooks_writer.set_hooks_from_job(self._reader)
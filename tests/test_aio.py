@@ -0,0 +1,112 @@
+import asyncio
+import os
+import sys
+import threading
+import unittest
+
+from impulsare_job.aio import AsyncReader, AsyncWriter, DbExecutor
+base_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, base_path + '/../')
+
+
+# https://docs.python.org/3/library/unittest.html#assert-methods
+class TestAio(unittest.TestCase):
+
+    _config_file = base_path + '/static/config_valid.yml'
+
+
+    def setUp(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        self.loop = asyncio.new_event_loop()
+
+
+    def tearDown(self):
+        self.loop.close()
+
+
+    def test_write_then_read(self):
+        async def write():
+            writer = await AsyncWriter.create(self._config_file)
+            writer.set_prop('name', 'test')
+            writer.set_prop('input', 'csv')
+            writer.set_prop('output', 'rest')
+            writer.fields_writer.add_field('input_test', 'output_test')
+            writer.fields_writer.add_rule(output_field='output_test', name='test', method='m', params={'a': 'b'})
+            writer.hooks_writer.add_hook(name='test', method='m', when='after_process')
+            self.assertEqual('test', await writer.get_prop('name'))
+
+            return await writer.save()
+
+        job = self.loop.run_until_complete(write())
+        self.assertEqual('test', job.name)
+
+        async def read():
+            reader = await AsyncReader.create(self._config_file, 'test')
+            self.assertEqual('rest', await reader.get_prop('output'))
+            return await reader.get_job(), await reader.get_hooks(), await reader.get_fields()
+
+        job, hooks, fields = self.loop.run_until_complete(read())
+        self.assertEqual('csv', job.input)
+        self.assertEqual(['test'], [hook.name for hook in hooks])
+        self.assertEqual({'a': 'b'}, fields[0].rules[0].params)
+
+        async def delete():
+            writer = await AsyncWriter.create(self._config_file, 'test')
+            await writer.delete()
+            await AsyncReader.create(self._config_file, 'test')
+
+        with self.assertRaisesRegex(ValueError, "Can't retrieve Job test"):
+            self.loop.run_until_complete(delete())
+
+
+    def test_concurrent_readers(self):
+        async def write(i: int):
+            writer = await AsyncWriter.create(self._config_file)
+            writer.set_prop('name', 'job_{}'.format(i))
+            writer.set_prop('input', 'csv')
+            writer.set_prop('output', 'rest')
+            await writer.save()
+
+        async def read(executor: DbExecutor, i: int):
+            reader = await AsyncReader.create(self._config_file, 'job_{}'.format(i), executor=executor)
+            return (await reader.get_compiled()).name
+
+        async def run(coroutines: list):
+            return await asyncio.gather(*coroutines)
+
+        executor = DbExecutor(max_pending=2)
+        self.loop.run_until_complete(run([write(i) for i in range(10)]))
+        names = self.loop.run_until_complete(run([read(executor, i) for i in range(10)]))
+        self.assertEqual(['job_{}'.format(i) for i in range(10)], names)
+        executor.shutdown()
+
+
+    def test_calls_in_executor(self):
+        threads = list()
+
+        def get_prop(prop: str):
+            threads.append(threading.current_thread())
+            return prop
+
+        async def run():
+            writer = await AsyncWriter.create(self._config_file)
+            writer._writer.get_prop = get_prop
+            reader = await AsyncReader.create(self._config_file, 'test')
+            reader._reader.get_prop = get_prop
+            return await writer.get_prop('name'), await reader.get_prop('name')
+
+        writer = self.loop.run_until_complete(AsyncWriter.create(self._config_file))
+        writer.set_prop('name', 'test')
+        writer.set_prop('input', 'csv')
+        writer.set_prop('output', 'rest')
+        self.loop.run_until_complete(writer.save())
+
+        self.assertEqual(('name', 'name'), self.loop.run_until_complete(run()))
+        self.assertEqual(2, len(threads))
+        self.assertNotIn(threading.current_thread(), threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import io
+import os
+import sqlite3
+import sys
+import unittest
+
+from impulsare_job import Reader, Writer
+from impulsare_job.bulk import Exporter, Importer
+base_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, base_path + '/../')
+
+
+# https://docs.python.org/3/library/unittest.html#assert-methods
+class TestBulk(unittest.TestCase):
+
+    _config_file = base_path + '/static/config_valid.yml'
+
+
+    def setUp(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        for i in range(3):
+            writer = Writer(self._config_file)
+            writer.set_prop('name', 'job_{}'.format(i))
+            writer.set_prop('input', 'csv')
+            writer.set_prop('input_parameters', {'delimiter': ';'})
+            writer.set_prop('output', 'rest')
+            writer.set_prop('mode', 'cu')
+            writer.hooks_writer.add_hook(name='hook', method='m', when='after_process', priority=2)
+            writer.fields_writer.add_field('input_a', 'output_a')
+            writer.fields_writer.add_field('input_b', 'output_b')
+            writer.fields_writer.add_rule(output_field='output_a', name='rule', method='m', params={'i': i},
+                                          blocking=True)
+            writer.save()
+
+
+    def test_export_import_jsonl(self):
+        self._export_import('jsonl')
+
+
+    def test_export_import_yaml(self):
+        self._export_import('yaml')
+
+
+    def test_import_replace(self):
+        stream = io.StringIO()
+        Exporter(self._config_file).export(stream)
+
+        writer = Writer(self._config_file, 'job_0')
+        writer.set_prop('description', 'changed')
+        writer.fields_writer.add_field('input_c', 'output_c')
+        writer.save()
+
+        with self.assertRaisesRegex(ValueError, 'Job #1 \\(job_0\\) is not valid: The job already exists'):
+            Importer(self._config_file).import_jobs(io.StringIO(stream.getvalue()), replace=False)
+
+        job_id, revision = writer.get_job().id, writer.get_job().revision
+        Importer(self._config_file).import_jobs(io.StringIO(stream.getvalue()))
+        reader = Reader(self._config_file, 'job_0')
+        self.assertIsNone(reader.get_job().description)
+        self.assertEqual(['output_a', 'output_b'], [field.output for field in reader.get_fields()])
+        self.assertEqual({'i': 0}, reader.get_fields()[0].rules[0].params)
+
+        # Same job, new revision
+        self.assertEqual(job_id, reader.get_job().id)
+        self.assertGreater(reader.get_job().revision, revision)
+
+        conn = sqlite3.connect('/tmp/test.db')
+        self.assertEqual((3, 6, 3), conn.execute('SELECT (SELECT COUNT(*) FROM hook), (SELECT COUNT(*) FROM field), '
+                                                 '(SELECT COUNT(*) FROM rule)').fetchone())
+        conn.close()
+
+
+    def test_import_snapshots(self):
+        stream = io.StringIO()
+        Exporter(self._config_file).export(stream)
+
+        config_file = base_path + '/static/config_snapshots.yml'
+        if os.path.isfile('/tmp/test_snapshots.db'):
+            os.remove('/tmp/test_snapshots.db')
+
+        self.assertEqual(3, Importer(config_file).import_jobs(io.StringIO(stream.getvalue()), batch_size=2))
+        job = Reader.load_snapshot(config_file, 'job_1')
+        self.assertEqual(Reader(config_file, 'job_1').get_compiled(), job)
+        self.assertEqual({'i': 1}, job.fields[0].rules[0].params)
+
+
+    def test_import_shares_db(self):
+        importer = Importer(self._config_file)
+        writer = importer._get_writer({'name': 'new', 'input': 'csv', 'output': 'rest'})
+        for db in (writer, writer.fields_writer, writer.hooks_writer):
+            self.assertIs(importer._config, db._config)
+            self.assertIs(importer._db, db._db)
+
+
+    def test_import_invalid(self):
+        lines = '{"name": "new_1", "input": "csv", "output": "rest"}\n'
+        lines += '{"name": "new_2", "input": "csv", "output": "rest", "mode": "wrong"}\n'
+
+        with self.assertRaisesRegex(ValueError, 'Job #2 \\(new_2\\) is not valid: wrong is not a valid mode'):
+            Importer(self._config_file).import_jobs(io.StringIO(lines))
+
+        # The whole batch is rolled back
+        conn = sqlite3.connect('/tmp/test.db')
+        self.assertEqual(3, conn.execute('SELECT COUNT(*) FROM job').fetchone()[0])
+        conn.close()
+
+        lines = '{"name": "new_1", "input": "csv", "output": "rest"}\n' * 2
+        with self.assertRaisesRegex(ValueError, 'Job #2 \\(new_1\\) is not valid: The job is already in the import'):
+            Importer(self._config_file).import_jobs(io.StringIO(lines))
+
+        lines = '{"name": "new_1", "input": "csv", "output": null}\n'
+        with self.assertRaisesRegex(ValueError, 'Job #1 \\(new_1\\) is not valid: Property output is required'):
+            Importer(self._config_file).import_jobs(io.StringIO(lines))
+
+        lines = '{"name": "new_1", "input": "csv", "output": "rest"}\n[]\n"x"\n'
+        with self.assertRaisesRegex(ValueError, 'Job #2 \\(None\\) is not valid: a job is an object, not list'):
+            Importer(self._config_file).import_jobs(io.StringIO(lines))
+
+        with self.assertRaisesRegex(ValueError, 'xml is not a valid format'):
+            Importer(self._config_file).import_jobs(io.StringIO(lines), 'xml')
+
+
+    def _export_import(self, format: str):
+        stream = io.StringIO()
+        self.assertEqual(3, Exporter(self._config_file).export(stream, format, batch_size=2))
+        exported = stream.getvalue()
+        if format == 'jsonl':
+            self.assertEqual(3, len(exported.splitlines()))
+
+        os.remove('/tmp/test.db')
+        self.assertEqual(3, Importer(self._config_file).import_jobs(io.StringIO(exported), format, batch_size=2))
+
+        job = Reader(self._config_file, 'job_2').get_compiled()
+        self.assertEqual({'delimiter': ';'}, job.input_parameters)
+        self.assertEqual('cu', job.mode)
+        self.assertEqual(('hook', 'after_process', 2), (job.hooks[0].name, job.hooks[0].when, job.hooks[0].priority))
+        self.assertEqual(['output_a', 'output_b'], [field.output for field in job.fields])
+        rule = job.fields[0].rules[0]
+        self.assertEqual(('rule', {'i': 2}, True), (rule.name, rule.params, rule.blocking))
+
+        # Exported again: the same
+        stream = io.StringIO()
+        Exporter(self._config_file).export(stream, format)
+        self.assertEqual(exported, stream.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
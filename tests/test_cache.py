@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import sys
+import unittest
+
+from impulsare_job import Reader, Writer
+from impulsare_job.cache import JobCache
+base_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, base_path + '/../')
+
+
+# https://docs.python.org/3/library/unittest.html#assert-methods
+class TestCache(unittest.TestCase):
+
+    _config_file = base_path + '/static/config_cache.yml'
+
+
+    def setUp(self):
+        if os.path.isfile('/tmp/test_cache.db'):
+            os.remove('/tmp/test_cache.db')
+
+
+    def test_lru(self):
+        cache = JobCache(2, 60)
+        cache.set('a', 1, 'data a')
+        cache.set('b', 1, 'data b')
+        self.assertEqual('data a', cache.get('a', None))
+        cache.set('c', 1, 'data c')
+
+        # b is the least recently used
+        self.assertIsNone(cache.get('b', None))
+        self.assertEqual('data a', cache.get('a', None))
+        self.assertEqual('data c', cache.get('c', None))
+
+        cache.invalidate('a')
+        self.assertIsNone(cache.get('a', None))
+        cache.invalidate()
+        self.assertIsNone(cache.get('c', None))
+
+
+    def test_ttl(self):
+        cache = JobCache(2, 0)
+        cache.set('a', 1, 'data a')
+        self.assertEqual('data a', cache.get('a', lambda: 1))
+        self.assertIsNone(cache.get('a', lambda: 2))
+        self.assertIsNone(cache.get('a', lambda: 1))
+
+
+    def test_iter_fields_not_cached(self):
+        self._create_job('test', 'output_a')
+
+        reader = Reader(self._config_file, 'test')
+        cached = reader.get_fields()[0]
+        field = next(reader.iter_fields())
+        self.assertEqual(cached.output, field.output)
+        self.assertIsNot(cached, field)
+
+
+    def test_disabled_by_default(self):
+        config_file = base_path + '/static/config_valid.yml'
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        writer = Writer(config_file)
+        writer.set_prop('name', 'test')
+        writer.set_prop('input', 'csv')
+        writer.set_prop('output', 'rest')
+        writer.save()
+
+        reader = Reader(config_file, 'test')
+        self.assertIsNone(reader._cache)
+        self.assertIsNot(reader.get_job(), Reader(config_file, 'test').get_job())
+        # Only the job is read
+        self.assertIsNone(reader._fields)
+        self.assertIsNone(reader._hooks)
+
+
+    def test_reader_uses_cache(self):
+        self._create_job('test', 'output_a')
+
+        reader = Reader(self._config_file, 'test')
+        job = reader.get_job()
+        self.assertEqual(1, job.revision)
+        self.assertEqual(['output_a'], [field.output for field in reader.get_fields()])
+        self.assertIn('test', reader._cache._entries)
+        self.assertEqual(job.__data__, Reader(self._config_file, 'test').get_job().__data__)
+
+        # Each reader gets a copy: changes made to it are not cached
+        job.description = 'changed'
+        reader.get_fields()[0].rules[0].params['a'] = 'changed'
+        reader = Reader(self._config_file, 'test')
+        self.assertIsNone(reader.get_job().description)
+        self.assertEqual({'a': 'b'}, reader.get_fields()[0].rules[0].params)
+
+        # Saved by the writer: invalidated
+        writer = Writer(self._config_file, 'test')
+        writer.fields_writer.add_field('input_b', 'output_b')
+        writer.save()
+        reader = Reader(self._config_file, 'test')
+        self.assertEqual(2, reader.get_job().revision)
+        self.assertEqual(['output_a', 'output_b'], [field.output for field in reader.get_fields()])
+
+        # Modified by another process: the revision changes
+        conn = sqlite3.connect('/tmp/test_cache.db')
+        conn.execute("UPDATE job SET revision = 3, description = 'changed' WHERE name = 'test'")
+        conn.commit()
+        conn.close()
+        self.assertEqual('changed', Reader(self._config_file, 'test').get_job().description)
+
+        # Deleted
+        Writer(self._config_file, 'test').delete()
+        with self.assertRaisesRegex(ValueError, "Can't retrieve Job test"):
+            Reader(self._config_file, 'test')
+
+
+    def test_revision_is_a_change_marker(self):
+        self._create_job('test', 'output_a')
+        self._create_job('test2', 'output_a')
+
+        writer = Writer(self._config_file, 'test')
+        writer.save()
+
+        self.assertEqual(3, Reader(self._config_file, 'test').get_job().revision)
+        self.assertEqual(2, Reader(self._config_file, 'test2').get_job().revision)
+
+
+    def _create_job(self, name: str, output: str):
+        writer = Writer(self._config_file)
+        writer.set_prop('name', name)
+        writer.set_prop('input', 'csv')
+        writer.set_prop('output', 'rest')
+        writer.fields_writer.add_field('input', output)
+        writer.fields_writer.add_rule(output_field=output, name='rule', method='m', params={'a': 'b'})
+
+        return writer.save()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import sys
+import threading
+import unittest
+
+from impulsare_job import Reader, Writer
+from impulsare_job.coordinator import WriteCoordinator
+base_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, base_path + '/../')
+
+
+# https://docs.python.org/3/library/unittest.html#assert-methods
+class TestCoordinator(unittest.TestCase):
+
+    _config_file = base_path + '/static/config_valid.yml'
+
+
+    def setUp(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        self.coordinator = WriteCoordinator(self._config_file)
+
+
+    def tearDown(self):
+        self.coordinator.stop()
+
+
+    def test_concurrent_saves(self):
+        futures = list()
+        lock = threading.Lock()
+
+        def submit(thread: int):
+            for i in range(10):
+                writer = self._get_writer('job_{}_{}'.format(thread, i))
+                future = self.coordinator.submit(writer)
+                with lock:
+                    futures.append(future)
+
+        threads = [threading.Thread(target=submit, args=(i, )) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        jobs = [future.result() for future in futures]
+        self.assertEqual(50, len(set(job.id for job in jobs)))
+
+        conn = sqlite3.connect('/tmp/test.db')
+        self.assertEqual(50, conn.execute('SELECT COUNT(*) FROM job').fetchone()[0])
+        self.assertEqual(50, conn.execute('SELECT COUNT(*) FROM field').fetchone()[0])
+        conn.close()
+
+        # Then update one
+        writer = Writer(self._config_file, 'job_0_0')
+        writer.set_prop('description', 'updated')
+        self.coordinator.save(writer)
+        self.assertEqual('updated', Reader(self._config_file, 'job_0_0').get_job().description)
+
+
+    def test_invalid_writer(self):
+        # No output: ValueError before the save starts
+        writer_ko = Writer(self._config_file)
+        writer_ko.set_prop('name', 'ko')
+        writer_ko.set_prop('input', 'csv')
+
+        future_ko = self.coordinator.submit(writer_ko)
+        future_ok = self.coordinator.submit(self._get_writer('ok'))
+        with self.assertRaisesRegex(ValueError, 'output'):
+            future_ko.result(timeout=10)
+        self.assertEqual('ok', future_ok.result(timeout=10).name)
+
+        # The writer thread is still running
+        self.assertEqual('other', self.coordinator.submit(self._get_writer('other')).result(timeout=10).name)
+
+
+    def test_failing_save_keeps_the_others(self):
+        writer_ok = self._get_writer('ok')
+        writer_ko = self._get_writer('ko')
+        writer_ko.fields_writer.add_rule(output_field='output', name='rule', method='m', params={'a': object()})
+
+        future_ko = self.coordinator.submit(writer_ko)
+        future_ok = self.coordinator.submit(writer_ok)
+        self.assertEqual('ok', future_ok.result().name)
+        with self.assertRaisesRegex(RuntimeError, "Can't insert the job 'ko'"):
+            future_ko.result()
+
+        conn = sqlite3.connect('/tmp/test.db')
+        self.assertEqual([('ok', )], conn.execute('SELECT name FROM job').fetchall())
+        conn.close()
+
+        # Fixed: it can be submitted again
+        writer_ko.fields_writer.del_rule('output', 'rule')
+        self.assertEqual('ko', self.coordinator.save(writer_ko).name)
+
+
+    def test_other_db(self):
+        writer = Writer(base_path + '/static/config_sqlite.yml')
+        with self.assertRaisesRegex(ValueError, "The writer doesn't use the coordinator's DB"):
+            self.coordinator.save(writer)
+
+
+    def _get_writer(self, name: str):
+        writer = Writer(self._config_file)
+        writer.set_prop('name', name)
+        writer.set_prop('input', 'csv')
+        writer.set_prop('output', 'rest')
+        writer.fields_writer.add_field('input', 'output')
+
+        return writer
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,12 @@
 import unittest
 import os
+import sqlite3
 import sys
+import threading
 
 base_path = os.path.abspath(os.path.dirname(__file__))
 sys.path.insert(0, base_path + '/../')
-from impulsare_job import Db
+from impulsare_job import Db, Reader, Writer, models
 from impulsare_config import utils
 
 
@@ -45,5 +47,261 @@ class TestReader(unittest.TestCase):
             Db(config_file)
 
 
+    def test_init_schema(self):
+        if os.path.isfile('/tmp/test_schema.db'):
+            os.remove('/tmp/test_schema.db')
+
+        db = models.open_db('/tmp/test_schema.db')
+        self.assertEqual(['deletedjob', 'field', 'hook', 'job', 'jobsnapshot', 'rule', 'setting'], self._get_tables(db))
+        version = db.execute_sql('PRAGMA user_version').fetchone()[0]
+        self.assertEqual(models.SCHEMA_VERSION, version)
+        self.assertIn('/tmp/test_schema.db', models._schema_ready)
+
+        # Already initialized: no query at all
+        db.close()
+        models.init_schema(db)
+        self.assertTrue(db.is_closed())
+
+        # The file is recreated: the schema is created again
+        os.remove('/tmp/test_schema.db')
+        db = models.open_db('/tmp/test_schema.db')
+        self.assertEqual(['deletedjob', 'field', 'hook', 'job', 'jobsnapshot', 'rule', 'setting'], self._get_tables(db))
+        db.close()
+
+
+    def test_shared_resources(self):
+        config_file = base_path + '/static/config_valid.yml'
+
+        db1 = Db(config_file)
+        db2 = Db(config_file)
+        self.assertIs(db1._config, db2._config)
+        self.assertIs(db1._logger, db2._logger)
+        self.assertIs(db1._db, db2._db)
+
+
+    def test_config_reloaded_when_modified(self):
+        config_file = '/tmp/test_config_reload.yml'
+        with open(config_file, 'w') as f:
+            f.write('job:\n    db: /tmp/test.db\n')
+        os.utime(config_file, (1000, 1000))
+
+        config = Db(config_file)._config
+        self.assertIs(config, Db(config_file)._config)
+
+        with open(config_file, 'w') as f:
+            f.write('job:\n    db: /tmp/test_reload.db\n')
+        os.utime(config_file, (2000, 2000))
+
+        db = Db(config_file)
+        self.assertIsNot(config, db._config)
+        self.assertEqual('/tmp/test_reload.db', db._config['job']['db'])
+        os.remove(config_file)
+
+
+    def test_indexes_migration(self):
+        if os.path.isfile('/tmp/test_schema.db'):
+            os.remove('/tmp/test_schema.db')
+
+        db = models.open_db('/tmp/test_schema.db')
+        indexes = [index.name for index in db.get_indexes('rule')]
+        self.assertIn('rule_field_id_priority', indexes)
+        self.assertIn('field_job_id_output', [index.name for index in db.get_indexes('field')])
+        self.assertIn('hook_job_id_priority', [index.name for index in db.get_indexes('hook')])
+        indexes = [index.name for index in db.get_indexes('job')]
+        for index in ('job_active_priority', 'job_mode_priority', 'job_input_priority', 'job_output_priority'):
+            self.assertIn(index, indexes)
+
+        # A DB from a previous version, without the indexes
+        db.execute_sql('DROP INDEX rule_field_id_priority')
+        db.execute_sql('PRAGMA user_version = 1')
+        db.close()
+        del models._schema_ready['/tmp/test_schema.db']
+
+        db = models.open_db('/tmp/test_schema.db')
+        self.assertIn('rule_field_id_priority', [index.name for index in db.get_indexes('rule')])
+        self.assertEqual(models.SCHEMA_VERSION, db.execute_sql('PRAGMA user_version').fetchone()[0])
+
+        plan = db.execute_sql('EXPLAIN QUERY PLAN SELECT * FROM hook WHERE job_id = 1 ORDER BY priority').fetchall()
+        self.assertIn('hook_job_id_priority', str(plan))
+        self.assertNotIn('TEMP B-TREE', str(plan))
+
+        sql = "EXPLAIN QUERY PLAN SELECT id FROM job WHERE output = 'rest' ORDER BY priority, id"
+        plan = db.execute_sql(sql).fetchall()
+        self.assertIn('job_output_priority', str(plan))
+        self.assertNotIn('TEMP B-TREE', str(plan))
+        db.close()
+
+
+    def test_columns_migration(self):
+        if os.path.isfile('/tmp/test_schema.db'):
+            os.remove('/tmp/test_schema.db')
+
+        # A job table from a previous version, without the revision
+        conn = sqlite3.connect('/tmp/test_schema.db')
+        conn.execute('CREATE TABLE job (id INTEGER PRIMARY KEY, date_entered DATETIME NOT NULL, name VARCHAR NOT NULL)')
+        conn.execute("INSERT INTO job VALUES (1, '2017-01-01', 'test')")
+        conn.execute('PRAGMA user_version = 2')
+        conn.commit()
+        conn.close()
+
+        db = models.open_db('/tmp/test_schema.db')
+        self.assertIn('revision', [column.name for column in db.get_columns('job')])
+        self.assertIn('job_revision', [index.name for index in db.get_indexes('job')])
+        self.assertEqual((1, 0, 1), db.execute_sql('SELECT id, revision, active FROM job').fetchone())
+        db.close()
+
+
+    def test_sqlite_pragmas(self):
+        db = Db(base_path + '/static/config_valid.yml')._db
+        self.assertEqual('wal', db.execute_sql('PRAGMA journal_mode').fetchone()[0])
+        self.assertEqual(1, db.execute_sql('PRAGMA synchronous').fetchone()[0])
+        self.assertEqual(5000, db.execute_sql('PRAGMA busy_timeout').fetchone()[0])
+
+        # Overriden from the config, the others keep the default
+        db = Db(base_path + '/static/config_sqlite.yml')._db
+        self.assertEqual('truncate', db.execute_sql('PRAGMA journal_mode').fetchone()[0])
+        self.assertEqual(2, db.execute_sql('PRAGMA synchronous').fetchone()[0])
+        self.assertEqual(1000, db.execute_sql('PRAGMA cache_size').fetchone()[0])
+        self.assertEqual(2, db.execute_sql('PRAGMA temp_store').fetchone()[0])
+        db.close()
+
+
+    def test_invalid_sqlite_pragma(self):
+        config_file = '/tmp/test_config_sqlite.yml'
+        with open(config_file, 'w') as f:
+            f.write('job:\n    db: /tmp/test.db\n    sqlite:\n        journal_mode: fast\n')
+
+        with self.assertRaisesRegex(ValueError, "Your config is not valid: 'fast' is not one of"):
+            Db(config_file)
+        os.remove(config_file)
+
+
+    def test_databases_per_thread(self):
+        for db_file in ('/tmp/test.db', '/tmp/test_sqlite.db'):
+            if os.path.isfile(db_file):
+                os.remove(db_file)
+
+        configs = [base_path + '/static/config_valid.yml', base_path + '/static/config_sqlite.yml']
+        errors = list()
+
+        def work(config_file: str, thread: int):
+            try:
+                for i in range(20):
+                    writer = Writer(config_file)
+                    writer.set_prop('name', 'job_{}_{}'.format(thread, i))
+                    writer.set_prop('input', 'csv')
+                    writer.set_prop('output', config_file)
+                    writer.save()
+                    job = Reader(config_file, 'job_{}_{}'.format(thread, i)).get_job()
+                    if job.output != config_file:
+                        errors.append(job.output)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                Db(config_file).close()
+
+        threads = [threading.Thread(target=work, args=(configs[i % 2], i)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+        for db_file, threads in (('/tmp/test.db', (0, 2)), ('/tmp/test_sqlite.db', (1, 3))):
+            conn = sqlite3.connect(db_file)
+            names = [row[0] for row in conn.execute('SELECT name FROM job')]
+            conn.close()
+            self.assertEqual(40, len(names))
+            self.assertEqual(set(threads), set(int(name.split('_')[1]) for name in names))
+
+
+    def test_databases_same_thread(self):
+        for db_file in ('/tmp/test.db', '/tmp/test_sqlite.db'):
+            if os.path.isfile(db_file):
+                os.remove(db_file)
+
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', 'test')
+        writer.set_prop('input', 'csv')
+        writer.set_prop('output', 'rest')
+
+        # Another DB is opened in between
+        Db(base_path + '/static/config_sqlite.yml')
+        writer.save()
+
+        conn = sqlite3.connect('/tmp/test.db')
+        self.assertEqual(1, conn.execute('SELECT COUNT(*) FROM job').fetchone()[0])
+        conn.close()
+
+
+    def test_no_database_in_thread(self):
+        Db(base_path + '/static/config_valid.yml')
+        errors = list()
+
+        def work():
+            try:
+                models.Job.select().count()
+            except AttributeError as e:
+                errors.append(str(e))
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+        self.assertEqual(['No DB for the current thread, open one first (Reader, Writer or open_db())'], errors)
+
+
+    def test_connections_released(self):
+        if os.path.isfile('/tmp/test_pool.db'):
+            os.remove('/tmp/test_pool.db')
+
+        db = models.open_db('/tmp/test_pool.db', pool={'max_connections': 2, 'timeout': 1})
+        db.close()
+        errors = list()
+
+        def work(close: bool):
+            try:
+                models.use_db(db)
+                models.Job.select().count()
+                if close:
+                    db.close()
+            except Exception as e:
+                errors.append(e)
+
+        # More threads than connections, most of them never call close()
+        for i in range(6):
+            thread = threading.Thread(target=work, args=(i % 3 == 0,))
+            thread.start()
+            thread.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(0, len(db._in_use))
+        db.close_all()
+
+
+    def test_close_with(self):
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', 'test')
+        writer.set_prop('input', 'csv')
+        writer.set_prop('output', 'rest')
+        writer.save()
+        closed = list()
+
+        def work():
+            with Reader(base_path + '/static/config_valid.yml', 'test') as reader:
+                reader.get_hooks()
+                closed.append(reader._db.is_closed())
+            closed.append(reader._db.is_closed())
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+        self.assertEqual([False, True], closed)
+
+
+    def _get_tables(self, db) -> list:
+        # Without the search index (and its shadow tables), only there if SQLite has FTS5
+        return [table for table in sorted(db.get_tables()) if not table.startswith('jobsearch')]
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,188 @@
+import os
+import pickle
+import sys
+import unittest
+
+from impulsare_job import Reader, Writer
+from impulsare_job.pipeline import MethodRegistry, RuleError, compile_pipeline
+base_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, base_path + '/../')
+
+
+def fail(value):
+    raise ValueError('{} is wrong'.format(value))
+
+
+# https://docs.python.org/3/library/unittest.html#assert-methods
+class TestPipeline(unittest.TestCase):
+
+    _config_file = base_path + '/static/config_valid.yml'
+
+
+    def setUp(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        self._registry = MethodRegistry({'upper': str.upper, 'fail': fail})
+
+        @self._registry.register('suffix')
+        def suffix(value, text='', repeat=1):
+            return value + text * repeat
+
+
+    def test_registry(self):
+        self.assertIn('suffix', self._registry)
+        self.assertNotIn('lower', self._registry)
+        self.assertIs(str.upper, self._registry.get('upper'))
+
+        with self.assertRaisesRegex(KeyError, 'The method lower is not registered'):
+            self._registry.get('lower')
+        with self.assertRaisesRegex(ValueError, 'The method lower must be callable'):
+            self._registry.register('lower', 'lower')
+
+
+    def test_transform(self):
+        writer = self._get_writer()
+        writer.fields_writer.add_rule(output_field='name', name='suffix', method='suffix',
+                                      params={'text': '!', 'repeat': 2}, priority=2)
+        writer.fields_writer.add_rule(output_field='name', name='upper', method='upper', priority=1)
+        writer.fields_writer.add_rule(output_field='name', name='inactive', method='unknown', active=False)
+        writer.save()
+
+        pipeline = Reader(self._config_file, 'test').get_pipeline(self._registry)
+        self.assertEqual(['upper', 'suffix'], [step[0] for step in pipeline.fields[1][2]])
+        data = pipeline.transform({'firstname': 'john', 'town': 'Paris'})
+        self.assertEqual({'name': 'JOHN!!', 'city': 'Paris'}, data)
+        self.assertEqual({'name': 'A!!', 'city': None}, pipeline.transform({'firstname': 'a'}))
+
+        # Picklable job, pipeline compiled where it's used
+        job = pickle.loads(pickle.dumps(pipeline.job))
+        pipeline = compile_pipeline(job, self._registry)
+        self.assertEqual({'name': 'B!!', 'city': None}, pipeline.transform({'firstname': 'b'}))
+
+
+    def test_errors(self):
+        writer = self._get_writer()
+        # Fields are ordered by output: city then name
+        writer.fields_writer.add_rule(output_field='city', name='optional', method='fail', priority=1)
+        writer.fields_writer.add_rule(output_field='city', name='upper', method='upper', priority=2)
+        writer.fields_writer.add_rule(output_field='name', name='required', method='fail', blocking=True)
+        writer.save()
+
+        pipeline = Reader(self._config_file, 'test').get_pipeline(self._registry)
+        errors = list()
+        with self.assertRaisesRegex(RuleError, "Rule 'required' of field 'name' failed \\(john is wrong\\)"):
+            pipeline.transform({'firstname': 'john', 'town': 'Paris'}, errors)
+
+        # Non blocking: skipped
+        self.assertEqual(1, len(errors))
+        self.assertEqual(('city', 'optional'), errors[0][:2])
+        self.assertIsInstance(errors[0][2], ValueError)
+
+        writer = Writer(self._config_file, 'test')
+        writer.fields_writer.del_rule('name', 'required')
+        writer.save()
+        pipeline = Reader(self._config_file, 'test').get_pipeline(self._registry)
+        self.assertEqual({'name': 'john', 'city': 'PARIS'}, pipeline.transform({'firstname': 'john', 'town': 'Paris'}))
+
+        writer.fields_writer.add_rule(output_field='city', name='unknown', method='unknown')
+        writer.save()
+        with self.assertRaisesRegex(KeyError, 'The method unknown is not registered'):
+            Reader(self._config_file, 'test').get_pipeline(self._registry)
+
+
+    def test_transform_columns(self):
+        calls = list()
+
+        @self._registry.register_vectorized('upper')
+        def upper(column):
+            calls.append(len(column))
+            return [value.upper() for value in column]
+
+        writer = self._get_writer()
+        writer.fields_writer.add_rule(output_field='name', name='upper', method='upper', priority=1)
+        writer.fields_writer.add_rule(output_field='name', name='suffix', method='suffix', params={'text': '!'},
+                                      blocking=True, priority=2)
+        writer.fields_writer.add_rule(output_field='city', name='optional', method='upper')
+        writer.save()
+
+        pipeline = Reader(self._config_file, 'test').get_pipeline(self._registry)
+        errors = list()
+        columns = {'firstname': ['john', 'jane', 'joe'], 'town': ['Paris', None, 'Lyon']}
+        data = pipeline.transform_columns(columns, errors)
+        self.assertEqual({'name': ['JOHN!', 'JANE!', 'JOE!'], 'city': ['PARIS', None, 'LYON']}, data)
+
+        # Vectorized for name, then for city but failed: applied row by row
+        self.assertEqual([3, 3], calls)
+        self.assertEqual([('city', 'optional', None), ('city', 'optional', 1)],
+                         [(output, name, row) for output, name, e, row in errors])
+
+        with self.assertRaisesRegex(RuleError, "Row 1: Rule 'suffix' of field 'name' failed"):
+            pipeline.transform_columns({'firstname': ['john', None]})
+
+        self.assertEqual({'name': [], 'city': []}, pipeline.transform_columns({}))
+
+
+    def test_transform_columns_no_fallback(self):
+        self._registry.register_vectorized('upper', lambda column: [value.upper() for value in column], fallback=False)
+
+        writer = self._get_writer()
+        writer.fields_writer.add_rule(output_field='name', name='upper', method='upper', blocking=True)
+        writer.fields_writer.add_rule(output_field='city', name='optional', method='upper')
+        writer.save()
+
+        pipeline = Reader(self._config_file, 'test').get_pipeline(self._registry)
+        errors = list()
+        data = pipeline.transform_columns({'firstname': ['john', 'jane'], 'town': ['Paris', None]}, errors)
+
+        # The column is kept as is, the error is not hidden
+        self.assertEqual({'name': ['JOHN', 'JANE'], 'city': ['Paris', None]}, data)
+        self.assertEqual([('city', 'optional', None)], [(output, name, row) for output, name, e, row in errors])
+
+        with self.assertRaisesRegex(RuleError, "^Rule 'upper' of field 'name' failed"):
+            pipeline.transform_columns({'firstname': ['john', None]})
+
+
+    def test_hooks(self):
+        calls = list()
+        self._registry.register('first', lambda context: calls.append(('first', context)))
+        self._registry.register('second', lambda context: calls.append(('second', context)))
+
+        writer = self._get_writer()
+        writer.hooks_writer.add_hook(name='second', method='second', when='after_process', priority=2)
+        writer.hooks_writer.add_hook(name='first', method='first', when='after_process', priority=1)
+        writer.hooks_writer.add_hook(name='before', method='first', when='before_process')
+        writer.hooks_writer.add_hook(name='inactive', method='unknown', when='after_process', active=False)
+        writer.save()
+
+        dispatcher = Reader(self._config_file, 'test').get_dispatcher(self._registry)
+        self.assertIn('before_process', dispatcher)
+        self.assertNotIn('after_batch', dispatcher)
+        self.assertEqual(2, len(dispatcher.hooks['after_process']))
+        self.assertIsNone(dispatcher.timings)
+
+        dispatcher.fire('after_process', {'processed': 10})
+        dispatcher.fire('after_batch')
+        self.assertEqual([('first', {'processed': 10}), ('second', {'processed': 10})], calls)
+
+        dispatcher = Reader(self._config_file, 'test').get_dispatcher(self._registry, timings=True)
+        dispatcher.fire('after_process')
+        dispatcher.fire('after_process')
+        dispatcher.fire('after_batch')
+        self.assertEqual(['after_process'], list(dispatcher.timings))
+        self.assertEqual(2, dispatcher.timings['after_process'][0])
+
+
+    def _get_writer(self):
+        writer = Writer(self._config_file)
+        writer.set_prop('name', 'test')
+        writer.set_prop('input', 'csv')
+        writer.set_prop('output', 'rest')
+        writer.fields_writer.add_field('firstname', 'name')
+        writer.fields_writer.add_field('town', 'city')
+
+        return writer
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@ import sys
 import unittest
 
 from impulsare_job import Reader, Writer
+from impulsare_job.reader import get_prefix_end
 base_path = os.path.abspath(os.path.dirname(__file__))
 sys.path.insert(0, base_path + '/../')
 
@@ -86,3 +87,218 @@ class TestReader(unittest.TestCase):
         self.assertIs(len(rules), 2)
         self.assertEqual(rules[0].name, 'test')
         self.assertEqual(rules[1].name, 'test2')
+
+
+    def test_get_fields_rules_grouped_by_field(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', self._job_name)
+        writer.set_prop('input', self._job_input)
+        writer.set_prop('output', self._job_output)
+        writer.fields_writer.add_field('input_a', 'output_a')
+        writer.fields_writer.add_field('input_b', 'output_b')
+        writer.fields_writer.add_field('input_c', 'output_c')
+        writer.fields_writer.add_rule(output_field='output_a', name='second', method='m', params={'x': 1}, priority=20)
+        writer.fields_writer.add_rule(output_field='output_a', name='first', method='m', priority=10)
+        writer.fields_writer.add_rule(output_field='output_b', name='only', method='m', params={'y': [1, 2]})
+        job = writer.save()
+
+        reader = Reader(base_path + '/static/config_valid.yml', job.name)
+        fields = reader.get_fields()
+        self.assertEqual(['output_a', 'output_b', 'output_c'], [field.output for field in fields])
+
+        self.assertEqual(['first', 'second'], [rule.name for rule in fields[0].rules])
+        self.assertEqual({'x': 1}, fields[0].rules[1].params)
+        self.assertEqual(['only'], [rule.name for rule in fields[1].rules])
+        self.assertEqual({'y': [1, 2]}, fields[1].rules[0].params)
+        self.assertEqual([], fields[2].rules)
+
+
+    def test_load_many(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        for i in range(3):
+            writer = Writer(base_path + '/static/config_valid.yml')
+            writer.set_prop('name', 'job_{}'.format(i))
+            writer.set_prop('input', self._job_input)
+            writer.set_prop('input_parameters', {'i': i})
+            writer.set_prop('output', self._job_output)
+            writer.set_prop('priority', 10 - i)
+            writer.set_prop('active', i != 1)
+            writer.fields_writer.add_field('input_test', 'output_{}'.format(i))
+            writer.fields_writer.add_rule(output_field='output_{}'.format(i), name='rule_{}'.format(i), method='m',
+                                          params={'i': i})
+            writer.hooks_writer.add_hook(name='hook_{}'.format(i), method='m', when='never')
+            writer.save()
+
+        readers = Reader.load_many(base_path + '/static/config_valid.yml', ['job_2', 'job_0'])
+        self.assertEqual(['job_2', 'job_0'], list(readers))
+        reader = readers['job_2']
+        self.assertIsInstance(reader, Reader)
+        self.assertEqual({'i': 2}, reader.get_job().input_parameters)
+        self.assertEqual(['hook_2'], [hook.name for hook in reader.get_hooks()])
+        fields = reader.get_fields()
+        self.assertEqual(['output_2'], [field.output for field in fields])
+        self.assertEqual({'i': 2}, fields[0].rules[0].params)
+        self.assertEqual(['output_0'], [field.output for field in readers['job_0'].get_fields()])
+
+        with self.assertRaisesRegex(ValueError, "Can't retrieve Job\\(s\\) nope"):
+            Reader.load_many(base_path + '/static/config_valid.yml', ['job_0', 'nope'])
+
+        # Only active jobs, by priority
+        readers = Reader.load_active(base_path + '/static/config_valid.yml')
+        self.assertEqual(['job_2', 'job_0'], list(readers))
+        self.assertEqual(['hook_0'], [hook.name for hook in readers['job_0'].get_hooks()])
+
+
+    def test_get_compiled(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', self._job_name)
+        writer.set_prop('input', self._job_input)
+        writer.set_prop('input_parameters', self._job_input_params)
+        writer.set_prop('output', self._job_output)
+        writer.fields_writer.add_field('input_b', 'output_b')
+        writer.fields_writer.add_field('input_a', 'output_a')
+        writer.fields_writer.add_rule(output_field='output_a', name='second', method='m2', priority=20)
+        writer.fields_writer.add_rule(output_field='output_a', name='first', method='m1', params={'a': 1}, priority=10)
+        writer.hooks_writer.add_hook(name='late', method='h2', when='after_process', priority=5)
+        writer.hooks_writer.add_hook(name='early', method='h1', when='after_process', priority=1)
+        job = writer.save()
+
+        compiled = Reader(base_path + '/static/config_valid.yml', job.name).get_compiled()
+        self.assertEqual(self._job_name, compiled.name)
+        self.assertEqual(self._job_input_params, compiled.input_parameters)
+        self.assertEqual(['early', 'late'], [hook.name for hook in compiled.hooks])
+        self.assertEqual(['output_a', 'output_b'], [field.output for field in compiled.fields])
+        self.assertEqual(['first', 'second'], [rule.name for rule in compiled.fields[0].rules])
+        self.assertEqual({'a': 1}, compiled.fields[0].rules[0].params)
+
+        with self.assertRaises(AttributeError):
+            compiled.name = 'other'
+        with self.assertRaises(AttributeError):
+            compiled.fields[0].rules[0].__dict__
+
+        compiled = Reader.load_compiled(base_path + '/static/config_valid.yml', [job.name])
+        self.assertEqual(['output_a', 'output_b'], [field.output for field in compiled[job.name].fields])
+
+
+    def test_lazy_params(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', self._job_name)
+        writer.set_prop('input', self._job_input)
+        writer.set_prop('input_parameters', self._job_input_params)
+        writer.set_prop('output', self._job_output)
+        writer.fields_writer.add_field('input_a', 'output_a')
+        writer.fields_writer.add_rule(output_field='output_a', name='rule', method='m', params={'a': 1})
+        writer.save()
+
+        # Decoded when read, once
+        job = Reader(base_path + '/static/config_valid.yml', self._job_name, use_cache=False).get_job()
+        self.assertIsInstance(job.__data__['input_parameters'], str)
+        self.assertEqual(self._job_input_params, job.input_parameters)
+        self.assertIs(job.input_parameters, job.input_parameters)
+        self.assertIsInstance(job.__data__['output_parameters'], str)
+
+        # Only some columns
+        readers = Reader.load_active(base_path + '/static/config_valid.yml', ['priority', 'description'])
+        reader = readers[self._job_name]
+        self.assertEqual(1, reader.get_prop('priority'))
+        self.assertIsNone(reader._job.input)
+        self.assertEqual({'a': 1}, reader.get_fields()[0].rules[0].params)
+
+        # The other columns are read when they are asked for
+        self.assertEqual(self._job_input, reader.get_prop('input'))
+        self.assertEqual(self._job_input_params, reader.get_job().input_parameters)
+        readers = Reader.load_active(base_path + '/static/config_valid.yml', ['priority'])
+        self.assertEqual(self._job_output, readers[self._job_name].get_compiled().output)
+
+        with self.assertRaisesRegex(ValueError, 'params is not a valid job column'):
+            Reader.load_many(base_path + '/static/config_valid.yml', [self._job_name], ['params'])
+
+        # Changed in place: saved with the job
+        job.input_parameters['delimiter'] = '|'
+        job.save()
+        job = Reader(base_path + '/static/config_valid.yml', self._job_name, use_cache=False).get_job()
+        self.assertEqual(dict(self._job_input_params, delimiter='|'), job.input_parameters)
+
+
+    def test_list_jobs(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        for i in range(12):
+            writer = Writer(base_path + '/static/config_valid.yml')
+            writer.set_prop('name', '{}_{:02d}'.format('csv' if i % 3 else 'api', i))
+            writer.set_prop('input', 'csv' if i % 3 else 'api')
+            writer.set_prop('input_parameters', {'i': i})
+            writer.set_prop('output', 'rest')
+            writer.set_prop('priority', i % 4)
+            writer.set_prop('active', i != 5)
+            writer.save()
+
+        config = base_path + '/static/config_valid.yml'
+        jobs = list(Reader.list_jobs(config, page_size=5))
+        self.assertEqual(12, len(jobs))
+        self.assertEqual((1, 'api_00', 0, True), jobs[0])
+        self.assertEqual([0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3], [job[2] for job in jobs])
+
+        jobs = list(Reader.list_jobs(config, ['name'], active=True, input='csv', min_priority=1, max_priority=2))
+        self.assertEqual([('csv_01',), ('csv_02',), ('csv_10',)], jobs)
+
+        jobs = list(Reader.list_jobs(config, ['name', 'input_parameters'], prefix='api_', dicts=True))
+        self.assertEqual(['api_00', 'api_09', 'api_06', 'api_03'], [job['name'] for job in jobs])
+        self.assertEqual({'i': 0}, jobs[0]['input_parameters'])
+
+        # No string after the highest code point
+        self.assertEqual([], list(Reader.list_jobs(config, ['name'], prefix='api_\U0010ffff')))
+        self.assertEqual('api`', get_prefix_end('api_\U0010ffff'))
+        self.assertIsNone(get_prefix_end('\U0010ffff'))
+        self.assertEqual('a\ue000', get_prefix_end('a\ud7ff'))
+
+        # Pages
+        page = list(Reader.list_jobs(config, ['priority', 'id', 'name'], limit=4, page_size=3))
+        self.assertEqual(4, len(page))
+        page = list(Reader.list_jobs(config, ['priority', 'id', 'name'], after=page[-1][:2], limit=100))
+        self.assertEqual(8, len(page))
+        self.assertEqual('csv_05', page[0][2])
+
+        with self.assertRaisesRegex(ValueError, 'params is not a valid job column'):
+            list(Reader.list_jobs(config, ['params']))
+
+
+    def test_iter_fields(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', self._job_name)
+        writer.set_prop('input', self._job_input)
+        writer.set_prop('output', self._job_output)
+        for i in range(25):
+            writer.fields_writer.add_field('input_{}'.format(i), 'output_{:02d}'.format(i))
+            writer.fields_writer.add_rule(output_field='output_{:02d}'.format(i), name='rule', method='m',
+                                          params={'i': i})
+        job = writer.save()
+
+        # Default construction: streamed from the DB, never all in memory
+        reader = Reader(base_path + '/static/config_valid.yml', job.name)
+        fields = reader.iter_fields(batch_size=10)
+        self.assertFalse(isinstance(fields, list))
+        fields = list(fields)
+        self.assertIsNone(reader._fields)
+        self.assertEqual(25, len(fields))
+        self.assertEqual([field.output for field in reader.get_fields()], [field.output for field in fields])
+        self.assertEqual({'i': 24}, fields[24].rules[0].params)
+
+        # Already loaded
+        reader = Reader.load_many(base_path + '/static/config_valid.yml', [job.name])[job.name]
+        self.assertEqual(reader.get_fields()[0], next(reader.iter_fields()))
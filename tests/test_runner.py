@@ -0,0 +1,118 @@
+import os
+import sys
+import unittest
+
+from impulsare_job import Writer
+from impulsare_job.pipeline import MethodRegistry
+from impulsare_job.runner import Runner
+base_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, base_path + '/../')
+
+
+# Module level: sent to the worker processes
+def to_int(value):
+    return int(value)
+
+
+calls = list()
+
+
+def log(context):
+    calls.append(context)
+
+
+registry = MethodRegistry({'to_int': to_int, 'upper': str.upper, 'log': log})
+
+
+# https://docs.python.org/3/library/unittest.html#assert-methods
+class TestRunner(unittest.TestCase):
+
+    _config_file = base_path + '/static/config_valid.yml'
+
+
+    def setUp(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        del calls[:]
+
+        writer = Writer(self._config_file)
+        writer.set_prop('name', 'test')
+        writer.set_prop('input', 'csv')
+        writer.set_prop('output', 'rest')
+        writer.fields_writer.add_field('id', 'id')
+        writer.fields_writer.add_field('firstname', 'name')
+        writer.fields_writer.add_rule(output_field='id', name='to_int', method='to_int', blocking=True)
+        writer.fields_writer.add_rule(output_field='name', name='upper', method='upper')
+        writer.hooks_writer.add_hook(name='start', method='log', when='before_process')
+        writer.hooks_writer.add_hook(name='end', method='log', when='after_process')
+        writer.hooks_writer.add_hook(name='inactive', method='unknown', when='after_process', active=False)
+        writer.save()
+
+        self._records = [{'id': str(i), 'firstname': 'name {}'.format(i)} for i in range(250)]
+        self._records[10]['id'] = 'wrong'
+        self._records[20]['firstname'] = None
+
+
+    def test_run(self):
+        runner = Runner(self._config_file, 'test', registry, processes=2, chunk_size=30)
+        records = list(runner.run(iter(self._records)))
+
+        self.assertEqual(249, len(records))
+        self.assertEqual(list(range(10)) + list(range(11, 250)), [record['id'] for record in records])
+        self.assertEqual({'id': 20, 'name': None}, records[19])
+        self.assertEqual('NAME 249', records[-1]['name'])
+
+        self.assertEqual((250, 1), (runner.processed, runner.rejected))
+        self.assertEqual([10, 20], [error[0] for error in runner.errors])
+        self.assertEqual(('id', 'to_int', True), runner.errors[0][1:3] + runner.errors[0][4:])
+        self.assertEqual(('name', 'upper', False), runner.errors[1][1:3] + runner.errors[1][4:])
+
+        # Hooks run in this process
+        self.assertEqual(2, len(calls))
+        self.assertEqual('test', calls[0]['job'].name)
+        self.assertEqual(250, calls[1]['processed'])
+
+
+    def test_run_unordered(self):
+        runner = Runner(self._config_file, 'test', registry, processes=3, chunk_size=7, ordered=False)
+        records = list(runner.run(self._records))
+        self.assertEqual(set(range(250)) - {10}, set(record['id'] for record in records))
+
+
+    def test_backpressure(self):
+        consumed = list()
+
+        def read():
+            for record in self._records:
+                consumed.append(record)
+                yield record
+
+        for ordered in (True, False):
+            del consumed[:]
+            runner = Runner(self._config_file, 'test', registry, processes=2, chunk_size=10,
+                            ordered=ordered, max_pending=3)
+            records = runner.run(read())
+            next(records)
+            # 3 chunks sent, then one more when the first is done
+            self.assertEqual(40, len(consumed))
+            self.assertEqual(249, 1 + len(list(records)))
+            self.assertEqual(250, len(consumed))
+
+
+    def test_run_in_process(self):
+        runner = Runner(self._config_file, 'test', registry, processes=0, timings=True)
+        self.assertEqual(249, len(list(runner.run(self._records))))
+        self.assertEqual(1, runner.rejected)
+        self.assertEqual(1, runner.hooks.timings['after_process'][0])
+        self.assertEqual([], list(runner.run([])))
+        self.assertEqual(0, runner.processed)
+
+
+    def test_missing_method(self):
+        with self.assertRaisesRegex(KeyError, 'The method log is not registered'):
+            Runner(self._config_file, 'test', MethodRegistry({'to_int': to_int, 'upper': str.upper}))
+
+
+if __name__ == "__main__":
+    unittest.main()
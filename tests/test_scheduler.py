@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import sys
+import threading
+import unittest
+
+from impulsare_job import Writer
+from impulsare_job.scheduler import Scheduler
+base_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, base_path + '/../')
+
+
+# https://docs.python.org/3/library/unittest.html#assert-methods
+class TestScheduler(unittest.TestCase):
+
+    _config_file = base_path + '/static/config_valid.yml'
+
+
+    def setUp(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        self._started = list()
+        self._lock = threading.Lock()
+
+
+    def test_refresh(self):
+        for name, priority in (('bulk', 50), ('urgent', 1), ('normal', 10)):
+            self._create_job(name, priority)
+        self._create_job('inactive', 1, active=False)
+
+        scheduler = Scheduler(self._config_file, self._run_job)
+        scheduler.refresh()
+        self.assertEqual(['urgent', 'normal', 'bulk'], [job.name for job in scheduler.get_queue()])
+
+        writer = Writer(self._config_file, 'bulk')
+        writer.set_prop('priority', 5)
+        writer.save()
+        writer = Writer(self._config_file, 'inactive')
+        writer.set_prop('active', True)
+        writer.set_prop('priority', 20)
+        writer.save()
+        Writer(self._config_file, 'urgent').delete()
+
+        scheduler.refresh()
+        self.assertEqual(['bulk', 'normal', 'inactive'], [job.name for job in scheduler.get_queue()])
+
+        # Deactivated then activated again, same priority
+        writer = Writer(self._config_file, 'normal')
+        writer.set_prop('active', False)
+        writer.save()
+        scheduler.refresh()
+        writer.set_prop('active', True)
+        writer.save()
+        scheduler.refresh()
+        self.assertEqual(['bulk', 'normal', 'inactive'], [job.name for job in scheduler.get_queue()])
+
+        scheduler.close()
+
+
+    def test_refresh_legacy_and_deleted(self):
+        self._create_job('legacy', 1)
+        self._create_job('other', 2)
+
+        # Created before the revisions
+        conn = sqlite3.connect('/tmp/test.db')
+        conn.execute("UPDATE job SET revision = 0 WHERE name = 'legacy'")
+        conn.commit()
+        conn.close()
+
+        scheduler = Scheduler(self._config_file, self._run_job)
+        scheduler.refresh()
+        self.assertEqual(['legacy', 'other'], [job.name for job in scheduler.get_queue()])
+
+        # Deleted, then its id reused by a new job
+        Writer(self._config_file, 'other').delete()
+        self._create_job('new', 3)
+        scheduler.refresh()
+        self.assertEqual(['legacy', 'new'], [job.name for job in scheduler.get_queue()])
+
+        Writer(self._config_file, 'legacy').delete()
+        scheduler.refresh()
+        self.assertEqual(['new'], [job.name for job in scheduler.get_queue()])
+        scheduler.close()
+
+
+    def test_run(self):
+        self._create_job('csv_1', 1, input='csv')
+        self._create_job('csv_2', 2, input='csv')
+        self._create_job('json_1', 3, input='json')
+        self._create_job('json_2', 4, input='json')
+
+        # One csv at a time: json_1 starts before csv_2
+        scheduler = Scheduler(self._config_file, self._run_job, workers=2, limits={'input': {'csv': 1}})
+        futures = scheduler.run()
+        self.assertEqual(['csv_1', 'json_1'], list(futures)[:2])
+        self.assertEqual(['csv_1', 'csv_2', 'json_1', 'json_2'], sorted(self._started))
+        self.assertEqual('CSV_2', futures['csv_2'].result())
+
+        # Nothing changed: no job loaded, all run again
+        futures = scheduler.run()
+        self.assertEqual(4, len(futures))
+        scheduler.close()
+
+        with self.assertRaisesRegex(ValueError, 'The limit for the output rest must be a positive integer'):
+            Scheduler(self._config_file, self._run_job, limits={'output': {'rest': 0}})
+        with self.assertRaisesRegex(ValueError, 'mode is not a valid limit'):
+            Scheduler(self._config_file, self._run_job, limits={'mode': {'c': 1}})
+
+
+    def _run_job(self, job):
+        with self._lock:
+            self._started.append(job.name)
+
+        return job.name.upper()
+
+
+    def _create_job(self, name: str, priority: int, active: bool = True, input: str = 'csv'):
+        writer = Writer(self._config_file)
+        writer.set_prop('name', name)
+        writer.set_prop('priority', priority)
+        writer.set_prop('active', active)
+        writer.set_prop('input', input)
+        writer.set_prop('output', 'rest')
+        writer.save()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import sys
+import unittest
+
+from impulsare_job import Reader, Writer
+from impulsare_job import models
+base_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, base_path + '/../')
+
+
+# https://docs.python.org/3/library/unittest.html#assert-methods
+@unittest.skipUnless(models.has_search(), 'SQLite without FTS5')
+class TestSearch(unittest.TestCase):
+
+    _config_file = base_path + '/static/config_valid.yml'
+
+
+    def setUp(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        self._create_job('customers', 'Import the customers', {'firstname': 'first_name', 'city': 'town'}, 'uppercase')
+        self._create_job('orders', 'Orders of the customers', {'customer_id': 'customer'}, 'to_int')
+        self._create_job('first_name', 'Names only', {'name': 'name'}, 'trim')
+
+
+    def test_search(self):
+        # The name counts more
+        self.assertEqual(['first_name', 'customers'], self._search('first_name'))
+        self.assertEqual(['customers'], self._search('firstname'))
+        self.assertEqual(['customers', 'orders'], sorted(self._search('customers')))
+        self.assertEqual(['orders'], self._search('rules:to_int'))
+        self.assertEqual(['customers'], self._search('fields:first_name'))
+        self.assertEqual([], self._search('unknown'))
+
+        results = Reader.search(self._config_file, 'customers', limit=1)
+        self.assertEqual(1, len(results))
+        self.assertGreater(results[0][1], 0)
+
+        with self.assertRaisesRegex(ValueError, 'AND is not a valid search'):
+            Reader.search(self._config_file, 'AND')
+
+
+    def test_sync(self):
+        writer = Writer(self._config_file, 'orders')
+        writer.fields_writer.del_field('customer')
+        writer.fields_writer.add_field('city', 'town')
+        writer.set_prop('name', 'sales')
+        writer.save()
+        self.assertEqual(['customers', 'sales'], sorted(self._search('town')))
+        self.assertEqual([], self._search('customer_id'))
+        self.assertEqual([], self._search('name:orders'))
+
+        Writer(self._config_file, 'customers').delete()
+        self.assertEqual(['sales'], self._search('town'))
+
+
+    def test_migration(self):
+        # Created by a version without the search index
+        conn = sqlite3.connect('/tmp/test.db')
+        conn.execute('DROP TABLE jobsearch')
+        conn.execute('PRAGMA user_version = 5')
+        conn.commit()
+        conn.close()
+
+        models._schema_ready.pop('/tmp/test.db')
+        self.assertEqual(['orders'], self._search('to_int'))
+
+
+    def test_missing_index(self):
+        # Created by a process without FTS5, already at the current version
+        conn = sqlite3.connect('/tmp/test.db')
+        conn.execute('DROP TABLE jobsearch')
+        conn.commit()
+        conn.close()
+
+        models._schema_ready.pop('/tmp/test.db')
+        self.assertEqual(['orders'], self._search('to_int'))
+
+
+    def test_stale_index(self):
+        # A process without FTS5 saves a job: the index can't be updated
+        models._fts5 = False
+        try:
+            self._create_job('sales', 'Sales', {'product': 'item'}, 'lower')
+            self.assertTrue(models.is_search_stale())
+        finally:
+            models._fts5 = None
+
+        self.assertEqual(['sales'], self._search('item'))
+        self.assertFalse(models.is_search_stale())
+
+
+    def _search(self, query: str) -> list:
+        return [name for name, score in Reader.search(self._config_file, query)]
+
+
+    def _create_job(self, name: str, description: str, fields: dict, method: str):
+        writer = Writer(self._config_file)
+        writer.set_prop('name', name)
+        writer.set_prop('description', description)
+        writer.set_prop('input', 'csv')
+        writer.set_prop('output', 'rest')
+        for input, output in fields.items():
+            writer.fields_writer.add_field(input, output)
+            writer.fields_writer.add_rule(output_field=output, name=method, method=method)
+        writer.save()
+
+
+if __name__ == "__main__":
+    unittest.main()
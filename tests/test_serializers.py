@@ -0,0 +1,123 @@
+import marshal
+import math
+import os
+import sqlite3
+import sys
+import unittest
+
+from impulsare_job import Reader, Writer
+from impulsare_job.serializers import decode, get_codec
+try:
+    import msgpack  # noqa: F401
+    has_msgpack = True
+except ImportError:
+    has_msgpack = False
+
+base_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, base_path + '/../')
+
+
+# https://docs.python.org/3/library/unittest.html#assert-methods
+class TestSerializers(unittest.TestCase):
+
+    _config_file = base_path + '/static/config_codec.yml'
+    _params = {'headers': False, 'table': {'a': [1, 2.5, None], 'b': 'é'}}
+
+
+    def setUp(self):
+        if os.path.isfile('/tmp/test_codec.db'):
+            os.remove('/tmp/test_codec.db')
+
+
+    def test_codecs(self):
+        for name in ('json', 'orjson', 'msgpack'):
+            try:
+                codec = get_codec(name)
+            except ValueError:
+                # orjson and msgpack are optional
+                continue
+
+            data = codec.encode(self._params)
+            self.assertEqual(self._params, decode(data), name)
+
+        self.assertIsInstance(get_codec().encode(self._params), str)
+        with self.assertRaisesRegex(ValueError, 'marshal is not a valid codec'):
+            get_codec('marshal')
+
+        self.assertIsNone(decode(None))
+        self.assertEqual({}, decode(''))
+        self.assertEqual({'a': float('inf')}, decode('{"a": Infinity}'))
+
+        with self.assertRaisesRegex(ValueError, 'xml is not a valid codec'):
+            get_codec('xml')
+        with self.assertRaisesRegex(ValueError, 'Unknown codec for the data'):
+            decode(b'\xffdata')
+        # Written by marshal, that can crash the interpreter: never read
+        with self.assertRaisesRegex(ValueError, 'Unknown codec for the data'):
+            decode(b'\x02' + marshal.dumps(self._params))
+
+
+    def test_non_finite_floats(self):
+        params = {'a': float('nan'), 'b': [1.5, {'c': float('-inf')}]}
+        for name in ('json', 'orjson'):
+            try:
+                codec = get_codec(name)
+            except ValueError:
+                # orjson is optional
+                continue
+
+            # Not written as null
+            data = codec.encode(params)
+            self.assertEqual(get_codec('json').encode(params), data, name)
+            decoded = decode(data)
+            self.assertTrue(math.isnan(decoded['a']), name)
+            self.assertEqual([1.5, {'c': float('-inf')}], decoded['b'], name)
+
+
+    @unittest.skipUnless(has_msgpack, 'msgpack is not installed')
+    def test_binary_params(self):
+        writer = Writer(self._config_file)
+        writer.set_prop('name', 'test')
+        writer.set_prop('input', 'csv')
+        writer.set_prop('input_parameters', self._params)
+        writer.set_prop('output', 'rest')
+        writer.fields_writer.add_field('input_a', 'output_a')
+        writer.fields_writer.add_rule(output_field='output_a', name='rule', method='m', params=self._params)
+        writer.save()
+
+        conn = sqlite3.connect('/tmp/test_codec.db')
+        row = conn.execute('SELECT typeof(input_parameters), typeof(output_parameters) FROM job').fetchone()
+        self.assertEqual(('blob', 'blob'), row)
+        self.assertEqual('blob', conn.execute('SELECT typeof(params) FROM rule').fetchone()[0])
+
+        # Written in JSON by another version: still readable
+        conn.execute('UPDATE job SET output_parameters = \'{"endpoint": "/posts"}\'')
+        conn.commit()
+        conn.close()
+
+        reader = Reader(self._config_file, 'test', use_cache=False)
+        self.assertEqual(self._params, reader.get_job().input_parameters)
+        self.assertEqual({'endpoint': '/posts'}, reader.get_job().output_parameters)
+        self.assertEqual(self._params, reader.get_fields()[0].rules[0].params)
+
+        # Resaved with the codec
+        writer = Writer(self._config_file, 'test')
+        writer.set_prop('priority', 2)
+        writer.save()
+        reader = Reader(self._config_file, 'test', use_cache=False)
+        self.assertEqual({'endpoint': '/posts'}, reader.get_job().output_parameters)
+        conn = sqlite3.connect('/tmp/test_codec.db')
+        self.assertEqual('blob', conn.execute('SELECT typeof(output_parameters) FROM job').fetchone()[0])
+        conn.close()
+
+        # Models saved directly use the codec of the DB too
+        job = reader.get_job()
+        job.input_parameters = {'b': 2}
+        job.save()
+        conn = sqlite3.connect('/tmp/test_codec.db')
+        self.assertEqual('blob', conn.execute('SELECT typeof(input_parameters) FROM job').fetchone()[0])
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import sys
+import unittest
+
+from impulsare_job import Reader, Writer
+from impulsare_job.compiled import decode_job, encode_job
+from impulsare_job.serializers import get_codec
+try:
+    import msgpack  # noqa: F401
+    has_msgpack = True
+except ImportError:
+    has_msgpack = False
+
+base_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, base_path + '/../')
+
+
+# https://docs.python.org/3/library/unittest.html#assert-methods
+class TestSnapshot(unittest.TestCase):
+
+    _config_file = base_path + '/static/config_snapshots.yml'
+
+
+    def setUp(self):
+        if os.path.isfile('/tmp/test_snapshots.db'):
+            os.remove('/tmp/test_snapshots.db')
+
+        writer = Writer(self._config_file)
+        writer.set_prop('name', 'test')
+        writer.set_prop('input', 'csv')
+        writer.set_prop('input_parameters', {'delimiter': ';'})
+        writer.set_prop('output', 'rest')
+        writer.hooks_writer.add_hook(name='hook', method='h', when='after_process')
+        writer.fields_writer.add_field('input_a', 'output_a')
+        writer.fields_writer.add_rule(output_field='output_a', name='rule', method='m', params={'a': [1, 2]})
+        writer.save()
+
+
+    def test_encode_decode(self):
+        job = Reader(self._config_file, 'test').get_compiled()
+        self.assertEqual(job, decode_job(encode_job(job, get_codec())))
+        self.assertEqual('rule', decode_job(encode_job(job, get_codec())).fields[0].rules[0].name)
+
+
+    def test_load_snapshot(self):
+        job = Reader.load_snapshot(self._config_file, 'test')
+        self.assertEqual(Reader(self._config_file, 'test').get_compiled(), job)
+        self.assertEqual({'a': [1, 2]}, job.fields[0].rules[0].params)
+
+        # Saved with the job, renamed
+        writer = Writer(self._config_file, 'test')
+        writer.set_prop('name', 'renamed')
+        writer.fields_writer.add_field('input_b', 'output_b')
+        writer.save()
+        self.assertEqual(['renamed'], self._get_snapshots())
+        job = Reader.load_snapshot(self._config_file, 'renamed')
+        self.assertEqual(['output_a', 'output_b'], [field.output for field in job.fields])
+        self.assertEqual(writer.get_job().revision, job.revision)
+
+        with self.assertRaisesRegex(ValueError, "Can't retrieve Job test"):
+            Reader.load_snapshot(self._config_file, 'test')
+
+        writer.delete()
+        self.assertEqual([], self._get_snapshots())
+
+
+    def test_fallback(self):
+        conn = sqlite3.connect('/tmp/test_snapshots.db')
+        conn.execute('UPDATE jobsnapshot SET version = 0')
+        conn.commit()
+        conn.close()
+
+        # Old format: read from the tables
+        job = Reader.load_snapshot(self._config_file, 'test')
+        self.assertEqual(Reader(self._config_file, 'test').get_compiled(), job)
+
+        # Disabled: removed on save
+        writer = Writer(self._config_file, 'test')
+        writer._config = dict(writer._config, job=dict(writer._config.get('job'), snapshots=False))
+        writer.save()
+        self.assertEqual([], self._get_snapshots())
+
+
+    @unittest.skipUnless(has_msgpack, 'msgpack is not installed')
+    def test_binary_params(self):
+        config_file = base_path + '/static/config_snapshots_codec.yml'
+        if os.path.isfile('/tmp/test_snapshots_codec.db'):
+            os.remove('/tmp/test_snapshots_codec.db')
+
+        # Values JSON can't keep as they are: encoded with the codec of the DB
+        params = {1: b'\x00\xff', 'list': (1, 2)}
+        writer = Writer(config_file)
+        writer.set_prop('name', 'test')
+        writer.set_prop('input', 'csv')
+        writer.set_prop('input_parameters', params)
+        writer.set_prop('output', 'rest')
+        writer.fields_writer.add_field('input_a', 'output_a')
+        writer.fields_writer.add_rule(output_field='output_a', name='rule', method='m', params=params)
+        writer.hooks_writer.add_hook(name='hook', method='h', when='after_process')
+        writer.save()
+
+        job = Reader.load_snapshot(config_file, 'test')
+        self.assertEqual(Reader(config_file, 'test', use_cache=False).get_compiled(), job)
+        self.assertEqual({1: b'\x00\xff', 'list': [1, 2]}, job.fields[0].rules[0].params)
+
+
+    def test_snapshot_from_writer(self):
+        # Built without reading the job again: the same as what's read from the tables
+        writer = Writer(self._config_file, 'test')
+        writer.hooks_writer.add_hook(name='first', method='h', when='after_process', priority=0)
+        writer.fields_writer.del_field('output_a')
+        writer.fields_writer.add_field('input_b', 'output_b')
+        writer.fields_writer.add_rule(output_field='output_b', name='b', method='m', priority=2)
+        writer.fields_writer.add_rule(output_field='output_b', name='a', method='m', params={'x': (1, 2)})
+        writer.save()
+
+        self.assertEqual(Reader(self._config_file, 'test', use_cache=False).get_compiled(), writer._get_compiled())
+        self.assertEqual(writer._get_compiled(), Reader.load_snapshot(self._config_file, 'test'))
+
+
+    def _get_snapshots(self) -> list:
+        conn = sqlite3.connect('/tmp/test_snapshots.db')
+        names = [row[0] for row in conn.execute('SELECT name FROM jobsnapshot')]
+        conn.close()
+
+        return names
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -174,6 +174,39 @@ class TestWriter(unittest.TestCase):
             Writer(base_path + '/static/config_valid.yml', job.name)
 
 
+    def test_delete_then_create(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', 'a')
+        writer.set_prop('input', self._job_input)
+        writer.set_prop('output', self._job_output)
+        writer.hooks_writer.add_hook(name='oldhook', method='m', when='after_process')
+        writer.fields_writer.add_field('old_in', 'old_out')
+        writer.fields_writer.add_rule(output_field='old_out', name='rule', method='m')
+        job_id = writer.save().id
+        Writer(base_path + '/static/config_valid.yml', 'a').delete()
+
+        conn = sqlite3.connect('/tmp/test.db')
+        counts = 'SELECT (SELECT COUNT(*) FROM hook), (SELECT COUNT(*) FROM field), (SELECT COUNT(*) FROM rule)'
+        self.assertEqual((0, 0, 0), conn.execute(counts).fetchone())
+
+        # The id is reused: nothing of the deleted job comes back
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', 'b')
+        writer.set_prop('input', self._job_input)
+        writer.set_prop('output', self._job_output)
+        writer.fields_writer.add_field('new_in', 'new_out')
+        self.assertEqual(job_id, writer.save().id)
+
+        writer = Writer(base_path + '/static/config_valid.yml', 'b')
+        self.assertEqual(['new_out'], list(writer.fields_writer.get_fields()))
+        self.assertEqual({}, writer.hooks_writer.get_hooks())
+        self.assertEqual((0, 1, 0), conn.execute(counts).fetchone())
+        conn.close()
+
+
     def test_get_add_delete_hooks(self):
         writer = Writer(base_path + '/static/config_valid.yml')
 
@@ -525,6 +558,125 @@ class TestWriter(unittest.TestCase):
         self.assertEqual(len(fieldInObj['rules']), 3)
 
 
+    def test_save_many_fields(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', self._job_name)
+        writer.set_prop('input', self._job_input)
+        writer.set_prop('output', self._job_output)
+        for i in range(500):
+            writer.fields_writer.add_field('input_{}'.format(i), 'output_{:03d}'.format(i))
+            writer.fields_writer.add_rule(output_field='output_{:03d}'.format(i), name='rule', method='method',
+                                          params={'i': i})
+            writer.fields_writer.add_rule(output_field='output_{:03d}'.format(i), name='rule2', method='method2')
+        job = writer.save()
+
+        jobInDb = self._get_job()
+        fieldsInDb = self._get_fields(jobInDb['id'], 500)
+        self.assertEqual('output_499', fieldsInDb[499]['output'])
+        rulesInDb = self._get_rules(fieldsInDb[499]['id'], 2)
+        self.assertEqual({'i': 499}, json.loads(rulesInDb[0]['params']))
+
+        # Save again: old fields and rules are replaced
+        writer = Writer(base_path + '/static/config_valid.yml', job.name)
+        writer.fields_writer.del_field('output_000')
+        writer.save()
+        fieldsInDb = self._get_fields(jobInDb['id'], 499)
+        self._get_rules(fieldsInDb[0]['id'], 2)
+
+        conn = sqlite3.connect('/tmp/test.db')
+        self.assertEqual(998, conn.execute('SELECT COUNT(*) FROM rule').fetchone()[0])
+
+
+    def test_save_is_atomic(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', self._job_name)
+        writer.set_prop('input', self._job_input)
+        writer.set_prop('output', self._job_output)
+        writer.fields_writer.add_field('input_test', 'output_test')
+        writer.fields_writer.add_rule(output_field='output_test', name='test', method='method', params={'a': object()})
+        with self.assertRaisesRegex(RuntimeError, "Can't insert the job 'test'"):
+            writer.save()
+
+        conn = sqlite3.connect('/tmp/test.db')
+        self.assertEqual(0, conn.execute('SELECT COUNT(*) FROM job').fetchone()[0])
+        self.assertEqual(0, conn.execute('SELECT COUNT(*) FROM field').fetchone()[0])
+
+        # Fix the rule then save again: the job is created
+        writer.fields_writer.del_rule('output_test', 'test')
+        writer.save()
+        self._get_fields(self._get_job()['id'], 1)
+
+
+    def test_save_only_changes(self):
+        if os.path.isfile('/tmp/test.db'):
+            os.remove('/tmp/test.db')
+
+        writer = Writer(base_path + '/static/config_valid.yml')
+        writer.set_prop('name', self._job_name)
+        writer.set_prop('input', self._job_input)
+        writer.set_prop('output', self._job_output)
+        writer.fields_writer.add_field('input_a', 'output_a')
+        writer.fields_writer.add_field('input_b', 'output_b')
+        writer.fields_writer.add_rule(output_field='output_a', name='keep', method='m', params={'a': 1})
+        writer.fields_writer.add_rule(output_field='output_a', name='change', method='m', params={'b': 1})
+        writer.fields_writer.add_rule(output_field='output_b', name='remove', method='m')
+        writer.hooks_writer.add_hook(name='keep', method='m', when='never')
+        writer.hooks_writer.add_hook(name='change', method='m', when='never')
+        writer.hooks_writer.add_hook(name='remove', method='m', when='never')
+        job = writer.save()
+
+        jobInDb = self._get_job()
+        fieldsBefore = self._get_fields(jobInDb['id'], 2)
+        rulesBefore = self._get_rules(fieldsBefore[0]['id'], 2)
+        hooksBefore = self._get_hooks(jobInDb['id'], 3)
+
+        writer = Writer(base_path + '/static/config_valid.yml', job.name)
+        writer.fields_writer.get_rules('output_a')['change']['params']['b'] = 2
+        writer.fields_writer.get_field('output_b')['input'] = 'input_b2'
+        writer.fields_writer.del_rule('output_b', 'remove')
+        writer.fields_writer.add_rule(output_field='output_b', name='new', method='m')
+        writer.fields_writer.add_field('input_c', 'output_c')
+        writer.fields_writer.add_rule(output_field='output_c', name='new', method='m')
+        writer.hooks_writer.get_hook('change')['when'] = 'always'
+        writer.hooks_writer.del_hook('remove')
+        writer.hooks_writer.add_hook(name='new', method='m', when='never')
+        writer.save()
+
+        # Same rows (ids) for what has been kept or changed
+        fieldsAfter = self._get_fields(jobInDb['id'], 3)
+        self.assertEqual(fieldsBefore[0]['id'], fieldsAfter[0]['id'])
+        self.assertEqual(fieldsBefore[1]['id'], fieldsAfter[1]['id'])
+        self.assertEqual('input_b2', fieldsAfter[1]['input'])
+
+        rulesAfter = self._get_rules(fieldsAfter[0]['id'], 2)
+        self.assertEqual([rule['id'] for rule in rulesBefore], [rule['id'] for rule in rulesAfter])
+        self.assertEqual({'b': 2}, json.loads(rulesAfter[0]['params']))
+        self.assertEqual({'a': 1}, json.loads(rulesAfter[1]['params']))
+
+        rulesAfter = self._get_rules(fieldsAfter[1]['id'], 1)
+        self.assertEqual('new', rulesAfter[0]['name'])
+        self._get_rules(fieldsAfter[2]['id'], 1)
+
+        hooksAfter = self._get_hooks(jobInDb['id'], 3)
+        self.assertEqual(['change', 'keep', 'new'], [hook['name'] for hook in hooksAfter])
+        self.assertEqual(hooksBefore[0]['id'], hooksAfter[0]['id'])
+        self.assertEqual('always', hooksAfter[0]['when'])
+        self.assertEqual(hooksBefore[1]['id'], hooksAfter[1]['id'])
+
+        # Save again with the same writer: the new rows are known now
+        writer.fields_writer.del_field('output_c')
+        writer.save()
+        self._get_fields(jobInDb['id'], 2)
+        conn = sqlite3.connect('/tmp/test.db')
+        self.assertEqual(3, conn.execute('SELECT COUNT(*) FROM rule').fetchone()[0])
+
+
     def test_bad_job_prop(self):
         writer = Writer(base_path + '/static/config_valid.yml')
         with self.assertRaisesRegex(KeyError, 'does_not_exist is not a valid job property'):